@@ -8,10 +8,13 @@ Amazon Product Review Scraper
 3. 支持登录获取Cookies实现持久化登录
 """
 
+import re
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
 import time
-import json
 import csv
+import operator
 import os
+import multiprocessing
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -19,32 +22,184 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import pickle
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+import lxml.html
+from lxml.cssselect import CSSSelector
+
+# Parquet输出（可选）
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+CHROME_PERF_ARGS = (
+    '--disable-gpu',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-sync',
+    '--disable-translate',
+    '--mute-audio',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--disable-features=Translate,BackForwardCache,AcceptCHFrame,MediaRouter,OptimizationHints',
+)
+REVIEWS_URL = "https://www.amazon.com/product-reviews/{asin}/"
+PRODUCT_URL = "https://www.amazon.com/dp/{asin}"
+# 每个抓取任务之后的延迟（秒），串行和并行抓取共用，避免请求过于集中被封
+TASK_DELAY = 2
+# 同一产品可能以 /dp/ASIN 或 /gp/product/ASIN 等不同路径出现
+ASIN_RE = re.compile(r'/(?:dp|gp/product)/([A-Z0-9]{10})')
+# "12 people found this helpful" / "One person found this helpful"
+HELPFUL_RE = re.compile(r'([\d,]+)\s+people|(One) person', re.IGNORECASE)
+
+
+# 评论字段选择器（模块导入时编译一次，解析时直接复用）
+REVIEW_SEL = CSSSelector("[data-hook='review']")
+REVIEWER_NAME_SEL = CSSSelector(".a-profile-name")
+RATING_SEL = CSSSelector("[data-hook='review-star-rating']")
+REVIEW_TITLE_SEL = CSSSelector("[data-hook='review-title']")
+REVIEW_DATE_SEL = CSSSelector("[data-hook='review-date']")
+REVIEW_BODY_SEL = CSSSelector("[data-hook='review-body']")
+VERIFIED_SEL = CSSSelector("[data-hook='avp-badge']")
+HELPFUL_SEL = CSSSelector("[data-hook='helpful-vote-statement']")
+PRODUCT_LINK_SEL = CSSSelector("[data-hook='product-link']")
+
+# 搜索结果选择器
+SEARCH_RESULT_SEL = CSSSelector("[data-component-type='s-search-result']")
+SEARCH_RESULT_FALLBACK_SEL = CSSSelector("div.s-result-item[data-asin]:not([data-asin=''])")
+# 产品链接按优先级依次尝试: h2 a -> a.s-link-style -> 任何包含/dp/的链接
+SEARCH_LINK_SELS = (
+    CSSSelector("h2 a"),
+    CSSSelector("a.s-link-style"),
+    CSSSelector("a[href*='/dp/']"),
+)
+
+# 在浏览器中一次性取出评论区和产品链接的HTML，代替传输整页 page_source
+REVIEWS_HTML_JS = """
+return Array.from(
+    document.querySelectorAll("[data-hook='review'], [data-hook='product-link']"),
+    el => el.outerHTML
+).join('');
+"""
+
+# 验证码页面的表单地址，出现即说明直连请求被反爬拦截
+CAPTCHA_MARKER = "/errors/validateCaptcha"
+
+
+def _first_text(selector, elem, default=""):
+    """返回选择器第一个匹配元素的文本，没有匹配时返回默认值（不依赖异常处理）"""
+    matches = selector(elem)
+    return matches[0].text_content().strip() if matches else default
+
+
+def _helpful_count(review_elem):
+    """从有用投票说明中解析出投票数，没有该元素或无法识别时返回 "0" """
+    matches = HELPFUL_SEL(review_elem)
+    if not matches:
+        return "0"
+    match = HELPFUL_RE.search(matches[0].text_content())
+    if not match:
+        return "0"
+    return match.group(1).replace(",", "") if match.group(1) else "1"
 
 
 class AmazonReviewScraper:
+    # Selenium 定位器（类加载时构造一次，避免每次调用都拼接字符串）
+    _SEARCH_RESULT_LOCATOR = (By.CSS_SELECTOR, "[data-component-type='s-search-result']")
+    _SEARCH_RESULT_FALLBACK_LOCATOR = (By.CSS_SELECTOR, "div.s-result-item[data-asin]:not([data-asin=''])")
+    _NEXT_PAGE_LOCATOR = (By.CSS_SELECTOR, "li.a-last a")
+    _REVIEW_LOCATOR = (By.CSS_SELECTOR, "[data-hook='review']")
+    _PRODUCT_TITLE_LOCATOR = (By.ID, "productTitle")
+    _ACCOUNT_LOCATOR = (By.ID, "nav-link-accountList")
+    
+    # 每条评论自身的字段；产品信息按产品只存一份，输出时再拼接
+    REVIEW_FIELDNAMES = [
+        'reviewer_name', 'rating', 'review_title', 'review_date', 'review_content',
+        'verified_purchase', 'helpful_count', 'scrape_time'
+    ]
+    # 输出文件的列顺序
+    FIELDNAMES = ['product_title', 'product_url'] + REVIEW_FIELDNAMES
+    # 按列顺序一次取出整行，供csv.writer直接写入元组（比DictWriter逐行校验字段快）
+    _row_getter = staticmethod(operator.itemgetter(*REVIEW_FIELDNAMES))
+    
+    # 星级筛选定位器，按星级(1-5)预先构造
+    _STAR_CSS = {
+        n: (By.CSS_SELECTOR, f"a[href*='filterByStar={n}_star']") for n in range(1, 6)
+    }
+    
     def __init__(self, headless=False):
         """初始化爬虫"""
         self.driver = self._setup_driver(headless)
-        self.cookies_file = "amazon_cookies.pkl"
-        self.reviews_data = []
+        self.cookies_file = "amazon_cookies.json"
+        # {product_url: {"meta": {product_title, product_url}, "reviews": [不含产品信息的评论]}}
+        self.reviews_data = {}
+        # run() 边抓取边写入的输出文件，首次写入时打开
+        self._csv_fp, self._csv_writer = None, None
+        self._json_fp = None
+        self.reviews_written = 0
+        # 复用同一个会话（HTTP keep-alive），所有直连请求共享连接池，登录成功后写入Cookies
+        self.http = self._setup_http_session()
         
     def _setup_driver(self, headless):
         """设置Selenium WebDriver"""
         options = webdriver.ChromeOptions()
         if headless:
-            options.add_argument('--headless')
+            options.add_argument('--headless=new')
         options.add_argument('--no-sandbox')
         options.add_argument('--disable-dev-shm-usage')
+        # 关闭与抓取无关的浏览器后台任务，减少启动和每页的开销
+        for arg in CHROME_PERF_ARGS:
+            options.add_argument(arg)
         options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_argument('user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+        options.add_argument(f'user-agent={USER_AGENT}')
         # Use a unique user data directory to avoid conflicts
         options.add_argument(f'--user-data-dir=/tmp/amazon_scraper_chrome_{os.getpid()}')
         
+        # 只读取HTML文本，不加载图片、样式表和字体以减少每页流量
+        prefs = {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+        }
+        options.add_experimental_option("prefs", prefs)
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        # DOMContentLoaded 后即返回，不等待广告、图片等延迟加载资源
+        options.page_load_strategy = 'eager'
+        
         driver = webdriver.Chrome(options=options)
         driver.maximize_window()
         return driver
     
+    def _setup_http_session(self):
+        """创建带连接池的requests会话，供评论页直连抓取使用"""
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+        session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept-Language": "en-US,en;q=0.9",
+        })
+        return session
+    
+    def _wait_for(self, *locators, timeout=10):
+        """
+        等待任一定位器对应的元素出现，元素就绪即返回，而不是固定等待
+        
+        Returns:
+            元素出现返回True，超时返回False
+        """
+        conditions = [EC.presence_of_element_located(locator) for locator in locators]
+        try:
+            WebDriverWait(self.driver, timeout).until(EC.any_of(*conditions))
+            return True
+        except TimeoutException:
+            return False
+    
     def login_and_save_cookies(self, email=None, password=None):
         """
         登录亚马逊并保存Cookies
@@ -54,7 +209,7 @@ class AmazonReviewScraper:
         print("正在打开亚马逊登录页面...")
         self.driver.get("https://www.amazon.com/ap/signin?openid.pape.max_auth_age=0&openid.return_to=https%3A%2F%2Fwww.amazon.com%2F&openid.identity=http%3A%2F%2Fspecs.openid.net%2Fauth%2F2.0%2Fidentifier_select&openid.assoc_handle=usflex&openid.mode=checkid_setup&openid.claimed_id=http%3A%2F%2Fspecs.openid.net%2Fauth%2F2.0%2Fidentifier_select&openid.ns=http%3A%2F%2Fspecs.openid.net%2Fauth%2F2.0")
         
-        time.sleep(3)
+        self._wait_for((By.ID, "ap_email"))
         
         if email and password:
             try:
@@ -62,7 +217,7 @@ class AmazonReviewScraper:
                 email_input = self.driver.find_element(By.ID, "ap_email")
                 email_input.send_keys(email)
                 email_input.send_keys(Keys.RETURN)
-                time.sleep(2)
+                self._wait_for((By.ID, "ap_password"))
                 
                 # 输入密码
                 password_input = self.driver.find_element(By.ID, "ap_password")
@@ -82,9 +237,11 @@ class AmazonReviewScraper:
             )
             print("登录成功！")
             
-            # 保存Cookies
+            # 保存Cookies，并同步到HTTP会话，使评论页可以直接走HTTP抓取
+            cookies = self.driver.get_cookies()
             with open(self.cookies_file, 'wb') as f:
-                pickle.dump(self.driver.get_cookies(), f)
+                f.write(orjson.dumps(cookies))
+            self.http.cookies.update({cookie["name"]: cookie["value"] for cookie in cookies})
             print(f"Cookies已保存到 {self.cookies_file}")
             return True
             
@@ -99,31 +256,45 @@ class AmazonReviewScraper:
             return False
         
         try:
-            self.driver.get("https://www.amazon.com")
-            time.sleep(2)
-            
             with open(self.cookies_file, 'rb') as f:
-                cookies = pickle.load(f)
-                for cookie in cookies:
-                    self.driver.add_cookie(cookie)
+                cookies = orjson.loads(f.read())
             
-            # 刷新页面以应用cookies
-            self.driver.refresh()
-            time.sleep(2)
+            # 通过CDP一次性写入全部Cookies（代替逐条add_cookie），
+            # 写入后直接打开首页即可生效，无需先加载再刷新
+            self.driver.execute_cdp_cmd("Network.setCookies", {
+                "cookies": [self._to_cdp_cookie(cookie) for cookie in cookies]
+            })
+            self.driver.get("https://www.amazon.com")
             
             # 验证是否登录成功
-            try:
-                self.driver.find_element(By.ID, "nav-link-accountList")
+            if self._wait_for(self._ACCOUNT_LOCATOR, timeout=5):
                 print("使用Cookies登录成功！")
+                self.http.cookies.update({cookie["name"]: cookie["value"] for cookie in cookies})
                 return True
-            except NoSuchElementException:
-                print("Cookies已过期，需要重新登录")
-                return False
+            print("Cookies已过期，需要重新登录")
+            return False
                 
         except Exception as e:
             print(f"加载Cookies失败: {e}")
             return False
     
+    @staticmethod
+    def _to_cdp_cookie(cookie):
+        """将Selenium格式的Cookie转换为CDP Network.setCookies所需的格式"""
+        cdp_cookie = {
+            "name": cookie["name"],
+            "value": cookie["value"],
+            "domain": cookie.get("domain", ".amazon.com"),
+            "path": cookie.get("path", "/"),
+            "secure": cookie.get("secure", False),
+            "httpOnly": cookie.get("httpOnly", False),
+        }
+        if "expiry" in cookie:
+            cdp_cookie["expires"] = cookie["expiry"]
+        if cookie.get("sameSite") in ("Strict", "Lax", "None"):
+            cdp_cookie["sameSite"] = cookie["sameSite"]
+        return cdp_cookie
+    
     def search_products(self, keyword, max_results=3):
         """
         搜索产品并获取前N个产品的详情页链接
@@ -137,7 +308,6 @@ class AmazonReviewScraper:
         """
         print(f"\n正在搜索产品: {keyword}")
         self.driver.get("https://www.amazon.com")
-        time.sleep(3)
         
         try:
             # 找到搜索框并输入关键词
@@ -150,76 +320,53 @@ class AmazonReviewScraper:
             
             # 等待搜索结果加载
             print("等待搜索结果加载...")
-            time.sleep(5)
+            self._wait_for(self._SEARCH_RESULT_LOCATOR, self._SEARCH_RESULT_FALLBACK_LOCATOR, timeout=15)
             
-            # 尝试多种选择器来查找产品
+            # 读取一次页面源码，之后所有查询都在内存中完成
+            tree = lxml.html.fromstring(self.driver.page_source)
             product_links = []
+            seen_asins = set()
             
             # 尝试方法1: data-component-type
-            products = self.driver.find_elements(By.CSS_SELECTOR, "[data-component-type='s-search-result']")
+            products = SEARCH_RESULT_SEL(tree)
             print(f"方法1找到 {len(products)} 个产品元素")
             
             # 如果方法1失败，尝试方法2
             if len(products) == 0:
-                products = self.driver.find_elements(By.CSS_SELECTOR, "div.s-result-item[data-asin]:not([data-asin=''])")
+                products = SEARCH_RESULT_FALLBACK_SEL(tree)
                 print(f"方法2找到 {len(products)} 个产品元素")
             
             for product in products:
                 if len(product_links) >= max_results:
                     break
-                    
-                try:
-                    # 尝试多种方式获取产品标题和链接
-                    link_element = None
-                    
-                    # 方法1: h2 a
-                    try:
-                        link_element = product.find_element(By.CSS_SELECTOR, "h2 a")
-                    except:
-                        pass
-                    
-                    # 方法2: a.s-link-style
-                    if not link_element:
-                        try:
-                            link_element = product.find_element(By.CSS_SELECTOR, "a.s-link-style")
-                        except:
-                            pass
-                    
-                    # 方法3: 任何包含/dp/的链接
-                    if not link_element:
-                        try:
-                            links = product.find_elements(By.CSS_SELECTOR, "a[href*='/dp/']")
-                            if links:
-                                link_element = links[0]
-                        except:
-                            pass
-                    
-                    if not link_element:
-                        continue
-                    
-                    product_url = link_element.get_attribute("href")
-                    product_title = link_element.text.strip()
-                    
-                    # 如果标题为空，尝试从aria-label获取
-                    if not product_title:
-                        product_title = link_element.get_attribute("aria-label")
-                    
-                    # 跳过空标题和URL
-                    if not product_title or not product_url:
-                        continue
-                    
-                    # 清理URL（移除多余参数）
-                    if "http" in product_url:
-                        product_url = product_url.split("?")[0] if "?" in product_url else product_url
-                        product_links.append({
-                            "title": product_title,
-                            "url": product_url
-                        })
-                        print(f"找到产品 {len(product_links)}: {product_title[:60]}...")
-                except Exception as e:
-                    # 调试信息
-                    # print(f"处理产品时出错: {e}")
+                
+                # 按优先级取第一个匹配的链接
+                link_element = next((links[0] for links in (sel(product) for sel in SEARCH_LINK_SELS) if links), None)
+                if link_element is None:
+                    continue
+                
+                product_url = link_element.get("href")
+                product_title = " ".join(link_element.text_content().split())
+                
+                # 如果标题为空，尝试从aria-label获取
+                if not product_title:
+                    product_title = link_element.get("aria-label")
+                
+                # 跳过空标题和URL
+                if not product_title or not product_url:
                     continue
+                
+                # 按ASIN去重，并统一为规范链接 https://www.amazon.com/dp/{asin}
+                match = ASIN_RE.search(product_url)
+                if not match or match.group(1) in seen_asins:
+                    continue
+                seen_asins.add(match.group(1))
+                product_url = PRODUCT_URL.format(asin=match.group(1))
+                product_links.append({
+                    "title": product_title,
+                    "url": product_url
+                })
+                print(f"找到产品 {len(product_links)}: {product_title[:60]}...")
             
             if len(product_links) == 0:
                 # 保存页面截图用于调试
@@ -250,85 +397,61 @@ class AmazonReviewScraper:
             max_pages: 抓取的最大页数
         
         Returns:
-            评论数据列表
+            (product_meta, reviews)：产品信息 {product_title, product_url} 和不含产品信息的评论列表，
+            可直接传给 add_reviews()
         """
+        match = ASIN_RE.search(product_url)
+        asin = match.group(1) if match else None
+        
+        if asin:
+            # 优先直接请求评论页，被拦截时再用浏览器打开同样的URL
+            if self.http.cookies:
+                result = self._scrape_reviews_by_url(
+                    asin, product_url, star_filter, max_pages, self._fetch_reviews_http
+                )
+                if result is not None:
+                    return result
+                print("直连请求被拦截，改用浏览器抓取")
+            
+            result = self._scrape_reviews_by_url(
+                asin, product_url, star_filter, max_pages, self._fetch_reviews_driver
+            )
+            return result or (self._product_meta("Unknown Product", product_url), [])
+        
+        # 无法识别ASIN时，只能打开产品页并通过点击进入评论页
         print(f"\n正在访问产品页面...")
         self.driver.get(product_url)
-        time.sleep(3)
+        self._wait_for(self._PRODUCT_TITLE_LOCATOR)
         
         try:
             # 获取产品标题
-            product_title = self.driver.find_element(By.ID, "productTitle").text
+            product_title = self.driver.find_element(*self._PRODUCT_TITLE_LOCATOR).text
             print(f"产品: {product_title}")
         except:
             product_title = "Unknown Product"
+        product_meta = self._product_meta(product_title, product_url)
         
         # 点击"查看所有评论"链接
         try:
-            # 方法1: 通过链接文本
             see_all_reviews = self.driver.find_element(By.PARTIAL_LINK_TEXT, "customer review")
             see_all_reviews.click()
-            time.sleep(3)
-        except:
-            try:
-                # 方法2: 直接构造评论页面URL
-                asin = product_url.split("/dp/")[1].split("/")[0] if "/dp/" in product_url else None
-                if asin:
-                    reviews_url = f"https://www.amazon.com/product-reviews/{asin}"
-                    self.driver.get(reviews_url)
-                    time.sleep(3)
-            except Exception as e:
-                print(f"无法访问评论页面: {e}")
-                return []
+            self._wait_for(self._REVIEW_LOCATOR)
+        except Exception as e:
+            print(f"无法访问评论页面: {e}")
+            return product_meta, []
         
-        # 应用星级筛选
+        # 应用星级筛选：有按钮就直接打开按钮链接，没有就改写URL参数，都不需要点击
         if star_filter:
+            print(f"应用 {star_filter} 星筛选...")
             try:
-                print(f"应用 {star_filter} 星筛选...")
-                
-                # 尝试多种方法来找到星级筛选按钮
-                star_element = None
-                
-                # 方法1: 使用href包含filterByStar
-                try:
-                    star_filter_xpath = f"//a[contains(@href, 'filterByStar={star_filter}_star')]"
-                    star_element = WebDriverWait(self.driver, 5).until(
-                        EC.element_to_be_clickable((By.XPATH, star_filter_xpath))
-                    )
-                except:
-                    pass
-                
-                # 方法2: 使用文本匹配
-                if not star_element:
-                    try:
-                        star_text = f"{star_filter} star"
-                        star_xpath = f"//a[contains(., '{star_text}')]"
-                        star_element = self.driver.find_element(By.XPATH, star_xpath)
-                    except:
-                        pass
-                
-                # 方法3: 使用CSS选择器
-                if not star_element:
-                    try:
-                        star_css = f"a[href*='filterByStar={star_filter}_star']"
-                        star_element = self.driver.find_element(By.CSS_SELECTOR, star_css)
-                    except:
-                        pass
-                
-                if star_element:
-                    # 滚动到元素位置避免被遮挡
-                    self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", star_element)
-                    time.sleep(1)
-                    # 尝试直接点击，如果失败则使用JavaScript点击
-                    try:
-                        star_element.click()
-                    except:
-                        self.driver.execute_script("arguments[0].click();", star_element)
-                    time.sleep(3)
-                    print(f"{star_filter} 星筛选已应用")
-                else:
-                    print(f"未找到 {star_filter} 星筛选按钮，将抓取所有评论")
-                    
+                star_element = self.driver.find_element(*self._STAR_CSS[star_filter])
+                star_url = star_element.get_attribute("href")
+            except (KeyError, NoSuchElementException):
+                star_url = self._with_query_param(self.driver.current_url, "filterByStar", f"{star_filter}_star")
+            try:
+                self.driver.get(star_url)
+                self._wait_for(self._REVIEW_LOCATOR)
+                print(f"{star_filter} 星筛选已应用")
             except Exception as e:
                 print(f"应用星级筛选失败: {e}，将抓取所有评论")
         
@@ -336,99 +459,177 @@ class AmazonReviewScraper:
         reviews = []
         for page in range(max_pages):
             print(f"正在抓取第 {page + 1} 页评论...")
-            page_reviews = self._extract_reviews_from_page(product_title, product_url)
+            page_reviews = self._extract_reviews_from_page()
             reviews.extend(page_reviews)
             print(f"本页抓取到 {len(page_reviews)} 条评论")
             
             # 尝试点击下一页
             if page < max_pages - 1:
                 try:
-                    next_button = self.driver.find_element(By.CSS_SELECTOR, "li.a-last a")
+                    next_button = self.driver.find_element(*self._NEXT_PAGE_LOCATOR)
                     next_button.click()
-                    time.sleep(3)
+                    # 等待旧页面失效后新评论出现
+                    WebDriverWait(self.driver, 10).until(EC.staleness_of(next_button))
+                    self._wait_for(self._REVIEW_LOCATOR)
                 except:
                     print("没有更多页面")
                     break
         
-        return reviews
+        return product_meta, reviews
     
-    def _extract_reviews_from_page(self, product_title, product_url):
-        """从当前页面提取评论数据"""
-        reviews = []
+    @staticmethod
+    def _product_meta(product_title, product_url):
+        """产品信息，每个产品只保存一份"""
+        return {"product_title": product_title, "product_url": product_url}
+    
+    def _extract_reviews_from_page(self):
+        """
+        从当前页面提取评论数据
         
+        只发起一次 WebDriver 请求取回评论区HTML，之后在内存中用 lxml 解析，
+        避免对每条评论的每个字段都发起一次 WebDriver 请求
+        """
         try:
-            review_elements = self.driver.find_elements(By.CSS_SELECTOR, "[data-hook='review']")
+            return self._parse_reviews(self._reviews_tree_from_driver())
+        except Exception as e:
+            print(f"提取评论时出错: {e}")
+            return []
+    
+    @staticmethod
+    def _with_query_param(url, key, value):
+        """返回设置了指定查询参数的新URL"""
+        parts = urlsplit(url)
+        params = dict(parse_qsl(parts.query))
+        params[key] = value
+        return urlunsplit(parts._replace(query=urlencode(params)))
+    
+    @staticmethod
+    def _reviews_page_url(asin, star_filter, page):
+        """构造评论页URL，翻页和星级筛选都只是查询参数，无需点击按钮"""
+        params = {"reviewerType": "all_reviews", "pageNumber": page}
+        if star_filter:
+            params["filterByStar"] = f"{star_filter}_star"
+        return f"{REVIEWS_URL.format(asin=asin)}?{urlencode(params)}"
+    
+    def _scrape_reviews_by_url(self, asin, product_url, star_filter, max_pages, fetch_page):
+        """
+        按构造好的评论页URL逐页抓取
+        
+        Args:
+            fetch_page: 请求URL并返回lxml文档的函数，被拦截时返回None
+        
+        Returns:
+            (product_meta, reviews)；第一页即被拦截或没有评论时返回None
+        """
+        reviews = []
+        product_title = "Unknown Product"
+        for page in range(1, max_pages + 1):
+            print(f"正在抓取第 {page} 页评论...")
+            tree = fetch_page(self._reviews_page_url(asin, star_filter, page))
+            if tree is None:
+                if page == 1:
+                    return None
+                break
             
-            for review_elem in review_elements:
-                try:
-                    review_data = {}
-                    
-                    # 评论者昵称
-                    try:
-                        reviewer = review_elem.find_element(By.CSS_SELECTOR, ".a-profile-name").text
-                        review_data["reviewer_name"] = reviewer
-                    except:
-                        review_data["reviewer_name"] = "Anonymous"
-                    
-                    # 评论星级
-                    try:
-                        rating_element = review_elem.find_element(By.CSS_SELECTOR, "[data-hook='review-star-rating']")
-                        rating_text = rating_element.get_attribute("textContent")
-                        rating = rating_text.split()[0] if rating_text else "N/A"
-                        review_data["rating"] = rating
-                    except:
-                        review_data["rating"] = "N/A"
-                    
-                    # 评论标题
-                    try:
-                        title = review_elem.find_element(By.CSS_SELECTOR, "[data-hook='review-title']").text
-                        review_data["review_title"] = title
-                    except:
-                        review_data["review_title"] = ""
-                    
-                    # 评论时间
-                    try:
-                        date = review_elem.find_element(By.CSS_SELECTOR, "[data-hook='review-date']").text
-                        review_data["review_date"] = date
-                    except:
-                        review_data["review_date"] = "N/A"
-                    
-                    # 评论内容
-                    try:
-                        content = review_elem.find_element(By.CSS_SELECTOR, "[data-hook='review-body']").text
-                        review_data["review_content"] = content
-                    except:
-                        review_data["review_content"] = ""
-                    
-                    # 验证购买
-                    try:
-                        verified = review_elem.find_element(By.CSS_SELECTOR, "[data-hook='avp-badge']")
-                        review_data["verified_purchase"] = "Yes"
-                    except:
-                        review_data["verified_purchase"] = "No"
-                    
-                    # 有用投票数
-                    try:
-                        helpful = review_elem.find_element(By.CSS_SELECTOR, "[data-hook='helpful-vote-statement']").text
-                        review_data["helpful_count"] = helpful
-                    except:
-                        review_data["helpful_count"] = "0"
-                    
-                    # 添加产品信息
-                    review_data["product_title"] = product_title
-                    review_data["product_url"] = product_url
-                    review_data["scrape_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    reviews.append(review_data)
-                    
-                except Exception as e:
-                    continue
+            if page == 1:
+                links = PRODUCT_LINK_SEL(tree)
+                if links:
+                    product_title = links[0].text_content().strip()
+                print(f"产品: {product_title}")
             
+            page_reviews = self._parse_reviews(tree)
+            if not page_reviews:
+                # 直连时第一页没有评论多半是页面被替换，交给调用方决定是否回退
+                if page == 1:
+                    return None
+                print("没有更多页面")
+                break
+            reviews.extend(page_reviews)
+            print(f"本页抓取到 {len(page_reviews)} 条评论")
+        
+        return self._product_meta(product_title, product_url), reviews
+    
+    def _fetch_reviews_http(self, url):
+        """
+        不经过浏览器直接请求评论页
+        
+        Returns:
+            lxml文档；请求失败或遇到反爬验证时返回None
+        """
+        try:
+            response = self.http.get(url, timeout=15)
+        except requests.RequestException as e:
+            print(f"请求评论页失败: {e}")
+            return None
+        
+        # 非200、被重定向到登录页或出现验证码都视为被拦截
+        if (response.status_code != 200
+                or "/ap/signin" in response.url
+                or CAPTCHA_MARKER in response.text):
+            return None
+        return lxml.html.fromstring(response.content)
+    
+    def _reviews_tree_from_driver(self):
+        """通过一次 execute_script 取回当前页面的评论区HTML并解析"""
+        html = self.driver.execute_script(REVIEWS_HTML_JS)
+        return lxml.html.fragment_fromstring(html or "", create_parent="div")
+    
+    def _fetch_reviews_driver(self, url):
+        """用浏览器直接打开评论页URL，返回解析后的lxml文档"""
+        try:
+            self.driver.get(url)
+            self._wait_for(self._REVIEW_LOCATOR)
+            return self._reviews_tree_from_driver()
         except Exception as e:
-            print(f"提取评论时出错: {e}")
+            print(f"无法访问评论页面: {e}")
+            return None
+    
+    def _parse_reviews(self, tree):
+        """从已解析的lxml文档中提取评论数据（不含产品信息）"""
+        reviews = []
+        # 同一页的评论共用一个抓取时间
+        scrape_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for review_elem in REVIEW_SEL(tree):
+            # 评论星级，形如 "5.0 out of 5 stars"
+            rating_text = _first_text(RATING_SEL, review_elem)
+            
+            reviews.append({
+                "reviewer_name": _first_text(REVIEWER_NAME_SEL, review_elem, "Anonymous"),
+                "rating": rating_text.split()[0] if rating_text else "N/A",
+                "review_title": _first_text(REVIEW_TITLE_SEL, review_elem),
+                "review_date": _first_text(REVIEW_DATE_SEL, review_elem, "N/A"),
+                "review_content": _first_text(REVIEW_BODY_SEL, review_elem),
+                "verified_purchase": "Yes" if VERIFIED_SEL(review_elem) else "No",
+                "helpful_count": _helpful_count(review_elem),
+                "scrape_time": scrape_time,
+            })
         
         return reviews
     
+    def add_reviews(self, product_meta, reviews):
+        """将 scrape_reviews() 的结果合并到 reviews_data 中对应产品的条目"""
+        entry = self.reviews_data.setdefault(
+            product_meta["product_url"], {"meta": product_meta, "reviews": []}
+        )
+        entry["reviews"].extend(reviews)
+    
+    @property
+    def review_count(self):
+        """reviews_data 中的评论总数"""
+        return sum(len(entry["reviews"]) for entry in self.reviews_data.values())
+    
+    def iter_reviews(self):
+        """逐条生成拼接了产品信息的完整评论记录（仅在输出时展开）"""
+        for entry in self.reviews_data.values():
+            meta = entry["meta"]
+            for review in entry["reviews"]:
+                yield {**meta, **review}
+    
+    def _csv_rows(self, product_meta, reviews):
+        """生成按 FIELDNAMES 顺序排列的CSV行元组"""
+        prefix = (product_meta["product_title"], product_meta["product_url"])
+        return (prefix + self._row_getter(review) for review in reviews)
+    
     def save_to_csv(self, filename="amazon_reviews.csv"):
         """保存评论数据到CSV文件"""
         if not self.reviews_data:
@@ -437,17 +638,13 @@ class AmazonReviewScraper:
         
         try:
             with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
-                fieldnames = [
-                    'product_title', 'product_url', 'reviewer_name', 'rating',
-                    'review_title', 'review_date', 'review_content', 
-                    'verified_purchase', 'helpful_count', 'scrape_time'
-                ]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(self.reviews_data)
+                writer = csv.writer(f)
+                writer.writerow(self.FIELDNAMES)
+                for entry in self.reviews_data.values():
+                    writer.writerows(self._csv_rows(entry["meta"], entry["reviews"]))
             
             print(f"\n数据已保存到 {filename}")
-            print(f"共保存 {len(self.reviews_data)} 条评论")
+            print(f"共保存 {self.review_count} 条评论")
         except Exception as e:
             print(f"保存CSV文件失败: {e}")
     
@@ -458,15 +655,71 @@ class AmazonReviewScraper:
             return
         
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.reviews_data, f, ensure_ascii=False, indent=2)
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(list(self.iter_reviews()), option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
             
             print(f"\n数据已保存到 {filename}")
-            print(f"共保存 {len(self.reviews_data)} 条评论")
+            print(f"共保存 {self.review_count} 条评论")
         except Exception as e:
             print(f"保存JSON文件失败: {e}")
     
-    def run(self, keyword, star_filters=[None], max_pages=2):
+    def save_to_parquet(self, filename="amazon_reviews.parquet"):
+        """
+        保存评论数据到Parquet文件（列式存储 + zstd压缩，适合大量评论）
+        
+        product_title/product_url 等重复列会被自动字典编码
+        """
+        if not PYARROW_AVAILABLE:
+            print("未安装pyarrow，无法保存Parquet文件: pip install pyarrow")
+            return
+        if not self.reviews_data:
+            print("没有数据可保存")
+            return
+        
+        try:
+            table = pa.Table.from_pylist(list(self.iter_reviews()))
+            pq.write_table(table, filename, compression='zstd')
+            
+            print(f"\n数据已保存到 {filename}")
+            print(f"共保存 {self.review_count} 条评论")
+        except Exception as e:
+            print(f"保存Parquet文件失败: {e}")
+    
+    def _append_reviews(self, product_meta, rows, csv_filename="amazon_reviews.csv", json_filename="amazon_reviews.jsonl"):
+        """
+        将一批评论追加写入CSV和NDJSON文件（每行一条JSON记录）
+        
+        文件在首次写入时打开，之后保持打开直到 _close_outputs()，
+        这样内存中只保留当前批次，而不是全部评论
+        """
+        if not rows:
+            return
+        
+        if self._csv_writer is None:
+            self._csv_fp = open(csv_filename, 'w', newline='', encoding='utf-8-sig')
+            self._csv_writer = csv.writer(self._csv_fp)
+            self._csv_writer.writerow(self.FIELDNAMES)
+            self._json_fp = open(json_filename, 'wb')
+        
+        self._csv_writer.writerows(self._csv_rows(product_meta, rows))
+        self._json_fp.write(b''.join(orjson.dumps({**product_meta, **row}) + b'\n' for row in rows))
+        self._csv_fp.flush()
+        self._json_fp.flush()
+        self.reviews_written += len(rows)
+    
+    def _close_outputs(self):
+        """关闭边抓取边写入的输出文件"""
+        if self._csv_fp is None:
+            return
+        
+        print(f"\n数据已保存到 {self._csv_fp.name} 和 {self._json_fp.name}")
+        print(f"共保存 {self.reviews_written} 条评论")
+        self._csv_fp.close()
+        self._json_fp.close()
+        self._csv_fp, self._csv_writer = None, None
+        self._json_fp = None
+    
+    def run(self, keyword, star_filters=[None], max_pages=2, workers=1):
         """
         运行完整的爬取流程
         
@@ -474,6 +727,7 @@ class AmazonReviewScraper:
             keyword: 搜索关键词
             star_filters: 星级筛选列表，例如 [5, 4] 或 [None] 表示不筛选
             max_pages: 每个产品每个星级抓取的页数
+            workers: 并行抓取的进程数，默认1（串行抓取）；每个进程会额外启动一个无头浏览器，建议不超过2-3
         """
         print("=" * 60)
         print("亚马逊产品评论爬虫")
@@ -494,43 +748,86 @@ class AmazonReviewScraper:
             print("未找到产品，退出程序")
             return
         
-        # 3. 对每个产品抓取评论
-        for idx, product in enumerate(products, 1):
-            print(f"\n{'=' * 60}")
-            print(f"处理产品 {idx}/{len(products)}")
-            print(f"{'=' * 60}")
-            
-            for star_filter in star_filters:
-                if star_filter:
-                    print(f"\n--- 抓取 {star_filter} 星评论 ---")
-                else:
-                    print(f"\n--- 抓取所有评论 ---")
+        # 3. 对每个产品、每个星级抓取评论
+        tasks = [
+            (self.cookies_file, product['url'], star_filter, max_pages)
+            for product in products
+            for star_filter in star_filters
+        ]
+        workers = min(workers, len(tasks))
+        
+        if workers <= 1:
+            for idx, (_, product_url, star_filter, _) in enumerate(tasks, 1):
+                print(f"\n{'=' * 60}")
+                print(f"处理任务 {idx}/{len(tasks)}")
+                print(f"{'=' * 60}")
                 
-                reviews = self.scrape_reviews(
-                    product['url'],
+                product_meta, reviews = self.scrape_reviews(
+                    product_url,
                     star_filter=star_filter,
                     max_pages=max_pages
                 )
-                self.reviews_data.extend(reviews)
+                self._append_reviews(product_meta, reviews)
                 
                 # 添加延迟避免被封
-                time.sleep(2)
+                time.sleep(TASK_DELAY)
+        else:
+            # 每个工作进程拥有独立的 ChromeDriver（Selenium 不能跨线程共享）
+            print(f"\n使用 {workers} 个进程并行抓取 {len(tasks)} 个任务...")
+            with multiprocessing.Pool(processes=workers) as pool:
+                for product_meta, reviews in pool.imap_unordered(_scrape_one, tasks):
+                    self._append_reviews(product_meta, reviews)
+                    print(f"已完成一个任务，累计 {self.reviews_written} 条评论")
         
-        # 4. 保存数据
+        # 4. 保存数据（评论已在抓取过程中写入文件）
         print(f"\n{'=' * 60}")
-        print(f"抓取完成！共获取 {len(self.reviews_data)} 条评论")
+        print(f"抓取完成！共获取 {self.reviews_written} 条评论")
         print(f"{'=' * 60}")
         
-        self.save_to_csv()
-        self.save_to_json()
+        if self.reviews_written:
+            self._close_outputs()
+        else:
+            print("没有数据可保存")
     
     def close(self):
-        """关闭浏览器"""
+        """关闭浏览器、HTTP会话和输出文件"""
+        self._close_outputs()
+        self.http.close()
         if self.driver:
             self.driver.quit()
             print("\n浏览器已关闭")
 
 
+def _scrape_one(task):
+    """
+    工作进程入口：用独立的无头浏览器抓取单个(产品, 星级)任务
+    
+    Args:
+        task: (cookies_file, product_url, star_filter, max_pages)
+    
+    Returns:
+        (product_meta, reviews)，与 scrape_reviews() 相同
+    """
+    cookies_file, product_url, star_filter, max_pages = task
+    scraper = None
+    try:
+        # 浏览器启动失败也只影响本任务，不中断其他任务
+        scraper = AmazonReviewScraper(headless=True)
+        scraper.cookies_file = cookies_file
+        if not scraper.load_cookies():
+            print("工作进程加载Cookies失败，以未登录状态继续抓取")
+        result = scraper.scrape_reviews(product_url, star_filter=star_filter, max_pages=max_pages)
+        # 与串行抓取相同，每个任务之后延迟，避免并行进程集中请求被封
+        time.sleep(TASK_DELAY)
+        return result
+    except Exception as e:
+        print(f"抓取任务失败: {e}")
+        return AmazonReviewScraper._product_meta("Unknown Product", product_url), []
+    finally:
+        if scraper is not None:
+            scraper.close()
+
+
 def main():
     """主函数 - 使用示例"""
     scraper = AmazonReviewScraper(headless=False)
@@ -66,21 +66,21 @@ def example_3_manual_control():
             print(f"\n只处理第一个产品: {products[0]['title']}")
             
             # 抓取5星评论
-            reviews_5star = scraper.scrape_reviews(
+            product_meta, reviews_5star = scraper.scrape_reviews(
                 products[0]['url'],
                 star_filter=5,
                 max_pages=1
             )
-            scraper.reviews_data.extend(reviews_5star)
+            scraper.add_reviews(product_meta, reviews_5star)
             print(f"5星评论数量: {len(reviews_5star)}")
             
             # 抓取1星评论
-            reviews_1star = scraper.scrape_reviews(
+            product_meta, reviews_1star = scraper.scrape_reviews(
                 products[0]['url'],
                 star_filter=1,
                 max_pages=1
             )
-            scraper.reviews_data.extend(reviews_1star)
+            scraper.add_reviews(product_meta, reviews_1star)
             print(f"1星评论数量: {len(reviews_1star)}")
         
         # 步骤4: 保存数据
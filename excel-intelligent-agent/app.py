@@ -2,10 +2,19 @@
 Excel智能体主应用
 整合所有模块，提供WebSocket和HTTP接口
 """
+# 安装了eventlet时使用eventlet异步服务器，并尽早打补丁，让OpenAI请求等阻塞I/O让出事件循环
+try:
+    import eventlet
+    eventlet.monkey_patch()
+    ASYNC_MODE = 'eventlet'
+except ImportError:
+    ASYNC_MODE = 'threading'
+
 import os
-import json
-import math
-from flask import Flask, render_template, request, jsonify
+import threading
+from collections import OrderedDict
+import orjson
+from flask import Flask, render_template, request, stream_with_context
 from flask_socketio import SocketIO, emit
 import openai
 import pandas as pd
@@ -16,36 +25,135 @@ from code_generator import CodeGenerator
 from code_executor import CodeExecutor
 
 
-def clean_nan_for_json(obj):
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _label_key(key):
+    """将索引标签转换为orjson可输出的字典键"""
+    if isinstance(key, tuple):
+        return '-'.join(map(str, key))
+    if key is None or type(key) in (str, int, float, bool):
+        return key
+    return str(key)
+
+
+def _orjson_default(obj):
     """
-    递归清理对象中的NaN值，将其转换为None（JSON中的null）
+    orjson无法直接序列化的对象：pandas容器、非C连续/object数组、NA标量等
+    （NaN浮点数和C连续的数值数组由orjson原生输出为null/列表）
     """
-    if isinstance(obj, dict):
-        return {key: clean_nan_for_json(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [clean_nan_for_json(item) for item in obj]
-    elif isinstance(obj, (float, np.floating)):
-        if pd.isna(obj) or math.isnan(obj):
-            return None
-        return obj
-    elif isinstance(obj, (int, np.integer)):
-        return int(obj)
-    elif pd.isna(obj):
+    if isinstance(obj, pd.DataFrame):
+        # 非默认索引（groupby/describe等结果）的行标签作为列保留
+        if not isinstance(obj.index, pd.RangeIndex):
+            obj = obj.reset_index()
+        # pandas按列存储，先整理为行优先的连续数组再逐行组装记录
+        columns = list(obj.columns)
+        rows = np.ascontiguousarray(obj.to_numpy(dtype=object)).tolist()
+        return [dict(zip(columns, row)) for row in rows]
+    if isinstance(obj, pd.Series) and not isinstance(obj.index, pd.RangeIndex):
+        # 带标签索引的Series（如groupby结果）输出为 {标签: 值}；
+        # 多级索引标签用'-'拼接，时间等orjson不支持作为键的标签转为字符串
+        return {_label_key(key): value for key, value in obj.to_dict().items()}
+    if (isinstance(obj, pd.Series) and isinstance(obj.dtype, np.dtype)
+            and (obj.dtype.kind in 'biu' or obj.dtype in (np.float32, np.float64))):
+        # 数值Series交给orjson的NumPy原生路径，NaN在C层直接输出为null，不经过tolist()
+        return np.ascontiguousarray(obj.to_numpy())
+    if isinstance(obj, np.ndarray) and not obj.flags.c_contiguous:
+        # orjson只原生输出C连续数组，转置/切片得到的视图先转为C连续
+        return np.ascontiguousarray(obj)
+    if isinstance(obj, (pd.Series, np.ndarray)):
+        return obj.tolist()
+    if pd.api.types.is_scalar(obj) and pd.isna(obj):
         return None
-    else:
-        return obj
+    return str(obj)
+
+
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj, option=ORJSON_OPTIONS, default=_orjson_default)
+
+
+def _json_response(obj, status=200):
+    """用orjson序列化响应，替代jsonify，无需预先清理NaN"""
+    return app.response_class(_dumps(obj), status=status, mimetype='application/json')
+
+
+class _OrjsonSocketJSON:
+    """提供给Flask-SocketIO的json模块，emit时同样由orjson序列化"""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return _dumps(obj).decode('utf-8')
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'excel-agent-secret-key'
-socketio = SocketIO(app, cors_allowed_origins="*")
+# 多进程部署时设置SOCKETIO_MESSAGE_QUEUE（如redis://localhost:6379/0），emit经消息队列分发到所有worker
+socketio = SocketIO(app, cors_allowed_origins="*", json=_OrjsonSocketJSON, async_mode=ASYNC_MODE,
+                    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'))
 
 # 初始化组件
 preprocessor = ExcelPreprocessor(knowledge_base_path="knowledge_base", openai_client=None, use_llm_analysis=False)
 nlp_parser = None  # 将在启动时初始化
 code_generator = CodeGenerator(openai_client=None)  # 将在初始化API密钥时设置
 
-# 存储当前会话数据
-session_data = {}
+class _LRUSessionStore(OrderedDict):
+    """按最近使用淘汰的会话存储，避免session_data随会话数无限增长"""
+    
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+    
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+# 存储当前会话数据（最多保留SESSION_DATA_MAX个会话）
+session_data = _LRUSessionStore(maxsize=int(os.environ.get('SESSION_DATA_MAX', 1024)))
+
+# code_generator.get_used_columns()、共享的执行器命名空间以及stdout重定向
+# 都是进程内共享状态，代码生成和执行需串行；耗时的意图解析不在锁内
+_pipeline_lock = threading.Lock()
+
+# 按数据文件路径复用的代码执行器
+_executor_cache: dict[str, CodeExecutor] = {}
+
+
+def _get_executor(file_path: str) -> CodeExecutor:
+    """获取（或创建）指定文件的代码执行器"""
+    executor = _executor_cache.get(file_path)
+    if executor is None:
+        executor = _executor_cache[file_path] = CodeExecutor(file_path)
+    return executor
+
+
+# get_all_files_info()的快照缓存，只在初始化/上传/重新加载时刷新；
+# 每次刷新生成新的dict，下游（如NLPParser的文件摘要）可按对象身份复用
+_files_info_cache = {'data': None}
+
+
+def _refresh_files_info() -> dict:
+    """文件集合变化后刷新文件信息缓存"""
+    _files_info_cache['data'] = dict(preprocessor.get_all_files_info())
+    return _files_info_cache['data']
+
+
+def _get_files_info() -> dict:
+    """获取缓存的文件信息，首次使用时惰性构建"""
+    if _files_info_cache['data'] is None:
+        return _refresh_files_info()
+    return _files_info_cache['data']
 
 
 @app.route('/')
@@ -57,10 +165,11 @@ def index():
 def _initialize_nlp_parser(api_key: str):
     """初始化NLP解析器的辅助函数"""
     global nlp_parser, preprocessor, code_generator
-    nlp_parser = NLPParser(api_key=api_key)
+    # 所有模块共享一个OpenAI客户端，复用同一个keep-alive连接池，避免每个模块各自握手
+    openai_client = openai.OpenAI(api_key=api_key)
+    nlp_parser = NLPParser(api_key=api_key, client=openai_client)
     
     # 同时更新preprocessor和code_generator的OpenAI客户端，启用LLM分析
-    openai_client = openai.OpenAI(api_key=api_key)
     preprocessor.openai_client = openai_client
     preprocessor.use_llm_analysis = True
     code_generator.openai_client = openai_client
@@ -74,7 +183,7 @@ def initialize():
     api_key = data.get('api_key') or os.environ.get('OPENAI_API')
     
     if not api_key:
-        return jsonify({'error': 'API密钥不能为空，请提供api_key或设置OPENAI_API环境变量'}), 400
+        return _json_response({'error': 'API密钥不能为空，请提供api_key或设置OPENAI_API环境变量'}, 400)
     
     try:
         # 初始化NLP解析器
@@ -82,16 +191,16 @@ def initialize():
         
         # 加载所有Excel文件
         files = preprocessor.load_all_files()
-        files_info = preprocessor.get_all_files_info()
+        files_info = _refresh_files_info()
         
-        return jsonify({
+        return _json_response({
             'success': True,
             'files': list(files.keys()),
             'files_info': files_info,
             'message': '初始化成功'
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json_response({'error': str(e)}, 500)
 
 
 @app.route('/api/query', methods=['POST'])
@@ -100,19 +209,21 @@ def query():
     data = request.json
     query_text = data.get('query')
     session_id = data.get('session_id', 'default')
+    # 只需要结构化结果的API调用方可传capture_output=false，跳过打印输出的捕获
+    capture_output = bool(data.get('capture_output', True))
     
     if not query_text:
-        return jsonify({'error': '查询不能为空'}), 400
+        return _json_response({'error': '查询不能为空'}, 400)
     
     if not nlp_parser:
-        return jsonify({'error': '请先初始化API密钥'}), 400
+        return _json_response({'error': '请先初始化API密钥'}, 400)
     
     try:
         # 获取可用文件信息
-        files_info = preprocessor.get_all_files_info()
+        files_info = _get_files_info()
         
         if not files_info:
-            return jsonify({'error': '没有可用的Excel文件，请先上传文件到knowledge_base目录'}), 400
+            return _json_response({'error': '没有可用的Excel文件，请先上传文件到knowledge_base目录'}, 400)
         
         # 解析查询
         intent = nlp_parser.parse_query(query_text, files_info)
@@ -120,7 +231,7 @@ def query():
         # 获取目标文件
         target_file = intent.get('target_file')
         if not target_file or target_file not in preprocessor.processed_files:
-            return jsonify({'error': f'找不到目标文件: {target_file}'}), 400
+            return _json_response({'error': f'找不到目标文件: {target_file}'}, 400)
         
         df = preprocessor.processed_files[target_file]
         file_path = preprocessor.file_metadata[target_file]['path']
@@ -130,16 +241,14 @@ def query():
         
         # 生成代码（传递原始查询文本）
         intent['original_query'] = query_text
-        generated_code = code_generator.generate_code(intent, file_path, df)
-        used_columns = code_generator.get_used_columns()
+        with _pipeline_lock:
+            generated_code = code_generator.generate_code(intent, file_path, df)
+            used_columns = code_generator.get_used_columns()
         
         # 执行代码
-        executor = CodeExecutor(file_path)
-        execution_result = executor.execute(generated_code)
-        
-        # 清理执行结果中的NaN值，确保可以JSON序列化
-        if execution_result.get('result'):
-            execution_result['result'] = clean_nan_for_json(execution_result['result'])
+        with _pipeline_lock:
+            executor = _get_executor(file_path)
+            execution_result = executor.execute(generated_code, capture_output=capture_output)
         
         # 保存会话数据
         session_data[session_id] = {
@@ -149,17 +258,99 @@ def query():
             'used_columns': used_columns
         }
         
-        return jsonify({
+        return _json_response({
             'success': True,
             'intent': intent,
             'code': generated_code,
-            'execution': clean_nan_for_json(execution_result),
+            'execution': execution_result,
             'used_columns': used_columns,
             'target_file': target_file
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json_response({'error': str(e)}, 500)
+
+
+def _iter_result_rows(data):
+    """逐行产出结果数据（DataFrame按行优先顺序转为记录）"""
+    if isinstance(data, pd.DataFrame):
+        columns = list(data.columns)
+        for row in np.ascontiguousarray(data.to_numpy(dtype=object)).tolist():
+            yield dict(zip(columns, row))
+    else:
+        yield from data
+
+
+@app.route('/api/query/stream', methods=['POST'])
+def query_stream():
+    """
+    处理查询请求，以NDJSON流返回（每行一个JSON对象）：
+    {"intent": ...}、{"code": ..., "used_columns": ..., "target_file": ...}、
+    {"execution": ...}（不含result['data']），随后result['data']的每条记录一行 {"row": ...}，
+    出错时为 {"error": ...}。适合结果很大的查询，/api/query保留给小结果。
+    """
+    data = request.json or {}
+    query_text = data.get('query')
+    session_id = data.get('session_id', 'default')
+    capture_output = bool(data.get('capture_output', True))
+    
+    if not query_text:
+        return _json_response({'error': '查询不能为空'}, 400)
+    
+    if not nlp_parser:
+        return _json_response({'error': '请先初始化API密钥'}, 400)
+    
+    def generate():
+        try:
+            files_info = _get_files_info()
+            if not files_info:
+                yield _dumps({'error': '没有可用的Excel文件，请先上传文件到knowledge_base目录'}) + b'\n'
+                return
+            
+            intent = nlp_parser.parse_query(query_text, files_info)
+            yield _dumps({'intent': intent}) + b'\n'
+            
+            target_file = intent.get('target_file')
+            if not target_file or target_file not in preprocessor.processed_files:
+                yield _dumps({'error': f'找不到目标文件: {target_file}'}) + b'\n'
+                return
+            
+            df = preprocessor.processed_files[target_file]
+            file_path = preprocessor.file_metadata[target_file]['path']
+            df.attrs['file_path'] = file_path
+            
+            intent['original_query'] = query_text
+            with _pipeline_lock:
+                generated_code = code_generator.generate_code(intent, file_path, df)
+                used_columns = code_generator.get_used_columns()
+            yield _dumps({'code': generated_code, 'used_columns': used_columns, 'target_file': target_file}) + b'\n'
+            
+            with _pipeline_lock:
+                executor = _get_executor(file_path)
+                execution_result = executor.execute(generated_code, capture_output=capture_output)
+            
+            session_data[session_id] = {
+                'intent': intent,
+                'code': generated_code,
+                'result': execution_result,
+                'used_columns': used_columns
+            }
+            
+            result = execution_result.get('result')
+            rows = None
+            if isinstance(result, dict) and isinstance(result.get('data'), (list, pd.DataFrame)):
+                rows = result['data']
+                result = {key: value for key, value in result.items() if key != 'data'}
+            yield _dumps({'execution': {**execution_result, 'result': result}}) + b'\n'
+            
+            if rows is not None:
+                for row in _iter_result_rows(rows):
+                    yield _dumps({'row': row}) + b'\n'
+        
+        except Exception as e:
+            yield _dumps({'error': str(e)}) + b'\n'
+    
+    return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 
 @socketio.on('connect')
@@ -177,9 +368,8 @@ def handle_disconnect():
 
 @socketio.on('voice_query')
 def handle_voice_query(data):
-    """处理语音查询"""
+    """处理语音查询：校验后交给后台任务，不阻塞Socket.IO的事件循环"""
     query_text = data.get('query')
-    session_id = data.get('session_id', 'default')
     
     if not query_text:
         emit('error', {'message': '查询不能为空'})
@@ -189,25 +379,33 @@ def handle_voice_query(data):
         emit('error', {'message': '请先初始化API密钥'})
         return
     
+    socketio.start_background_task(_process_voice_query, request.sid, data)
+
+
+def _process_voice_query(sid, data):
+    """在后台任务中执行语音查询流程，通过room=sid把进度推送给发起的客户端"""
+    query_text = data.get('query')
+    session_id = data.get('session_id', 'default')
+    
     try:
         # 发送处理中状态
-        emit('processing', {'message': '正在处理您的查询...'})
+        socketio.emit('processing', {'message': '正在处理您的查询...'}, room=sid)
         
         # 获取可用文件信息
-        files_info = preprocessor.get_all_files_info()
+        files_info = _get_files_info()
         
         if not files_info:
-            emit('error', {'message': '没有可用的Excel文件'})
+            socketio.emit('error', {'message': '没有可用的Excel文件'}, room=sid)
             return
         
-        # 解析查询
+        # 解析查询（OpenAI请求，多个客户端可并发进行）
         intent = nlp_parser.parse_query(query_text, files_info)
-        emit('intent_parsed', {'intent': intent})
+        socketio.emit('intent_parsed', {'intent': intent}, room=sid)
         
         # 获取目标文件
         target_file = intent.get('target_file')
         if not target_file or target_file not in preprocessor.processed_files:
-            emit('error', {'message': f'找不到目标文件: {target_file}'})
+            socketio.emit('error', {'message': f'找不到目标文件: {target_file}'}, room=sid)
             return
         
         df = preprocessor.processed_files[target_file]
@@ -216,23 +414,21 @@ def handle_voice_query(data):
         
         # 生成代码（传递原始查询文本）
         intent['original_query'] = query_text
-        generated_code = code_generator.generate_code(intent, file_path, df)
-        used_columns = code_generator.get_used_columns()
-        emit('code_generated', {'code': generated_code, 'used_columns': used_columns})
+        with _pipeline_lock:
+            generated_code = code_generator.generate_code(intent, file_path, df)
+            used_columns = code_generator.get_used_columns()
+        socketio.emit('code_generated', {'code': generated_code, 'used_columns': used_columns}, room=sid)
         
         # 执行代码
-        executor = CodeExecutor(file_path)
-        execution_result = executor.execute(generated_code)
-        
-        # 清理执行结果中的NaN值，确保可以JSON序列化
-        if execution_result.get('result'):
-            execution_result['result'] = clean_nan_for_json(execution_result['result'])
+        with _pipeline_lock:
+            executor = _get_executor(file_path)
+            execution_result = executor.execute(generated_code)
         
-        emit('execution_complete', {
-            'result': clean_nan_for_json(execution_result),
+        socketio.emit('execution_complete', {
+            'result': execution_result,
             'used_columns': used_columns,
             'target_file': target_file
-        })
+        }, room=sid)
         
         # 保存会话数据
         session_data[session_id] = {
@@ -243,21 +439,21 @@ def handle_voice_query(data):
         }
         
     except Exception as e:
-        emit('error', {'message': str(e)})
+        socketio.emit('error', {'message': str(e)}, room=sid)
 
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """上传Excel文件"""
     if 'file' not in request.files:
-        return jsonify({'error': '没有文件'}), 400
+        return _json_response({'error': '没有文件'}, 400)
     
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': '文件名不能为空'}), 400
+        return _json_response({'error': '文件名不能为空'}, 400)
     
     if not file.filename.endswith(('.xlsx', '.xls')):
-        return jsonify({'error': '只支持Excel文件(.xlsx, .xls)'}), 400
+        return _json_response({'error': '只支持Excel文件(.xlsx, .xls)'}, 400)
     
     try:
         # 保存文件
@@ -268,22 +464,23 @@ def upload_file():
         # 加载文件
         df = preprocessor.load_excel_file(file_path)
         file_info = preprocessor.get_file_info(file.filename)
+        _refresh_files_info()
         
-        return jsonify({
+        return _json_response({
             'success': True,
             'message': '文件上传成功',
             'file_name': file.filename,
             'file_info': file_info
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json_response({'error': str(e)}, 500)
 
 
 @app.route('/api/files', methods=['GET'])
 def list_files():
     """列出所有文件"""
-    files_info = preprocessor.get_all_files_info()
-    return jsonify({
+    files_info = _get_files_info()
+    return _json_response({
         'files': list(files_info.keys()),
         'files_info': files_info
     })
@@ -293,22 +490,18 @@ def list_files():
 def reload_files():
     """重新加载所有Excel文件"""
     try:
-        # 清空已加载的文件
-        preprocessor.processed_files.clear()
-        preprocessor.file_metadata.clear()
+        # 重新加载所有文件：未修改的文件沿用已解析的数据，删除的文件被移除
+        files = preprocessor.load_all_files(skip_unchanged=True)
+        files_info = _refresh_files_info()
         
-        # 重新加载所有文件
-        files = preprocessor.load_all_files()
-        files_info = preprocessor.get_all_files_info()
-        
-        return jsonify({
+        return _json_response({
             'success': True,
             'message': f'成功重新加载 {len(files)} 个文件',
             'files': list(files.keys()),
             'files_info': files_info
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json_response({'error': str(e)}, 500)
 
 
 if __name__ == '__main__':
@@ -344,8 +537,15 @@ if __name__ == '__main__':
     # 获取端口号（环境变量或默认5001，因为5000可能被macOS AirPlay占用）
     port = int(os.environ.get('PORT', 5001))
     
+    # 调试模式（自动重载、调试器）需显式开启：FLASK_DEBUG=1
+    debug = os.environ.get('FLASK_DEBUG') == '1'
+    
     # 启动服务器
-    print(f"\nStarting Excel Intelligent Agent on http://0.0.0.0:{port}")
+    print(f"\nStarting Excel Intelligent Agent on http://0.0.0.0:{port} (async mode: {ASYNC_MODE}, debug: {debug})")
     print(f"Open your browser and navigate to http://localhost:{port}")
-    socketio.run(app, host='0.0.0.0', port=port, debug=True, allow_unsafe_werkzeug=True)
+    if ASYNC_MODE == 'eventlet':
+        socketio.run(app, host='0.0.0.0', port=port, debug=debug)
+    else:
+        # 未安装eventlet时回退到Werkzeug服务器
+        socketio.run(app, host='0.0.0.0', port=port, debug=debug, allow_unsafe_werkzeug=True)
 
@@ -2,19 +2,139 @@
 代码执行模块
 执行生成的Python代码并返回结果
 """
-import sys
+import ast
 import io
+import sys
 import traceback
 from contextlib import redirect_stdout, redirect_stderr
+from functools import lru_cache
 from typing import Dict, Any, Optional
+import datetime
+import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')  # 使用非交互式后端
+import matplotlib.pyplot as plt
+
+try:
+    import numexpr  # noqa: F401
+    NUMEXPR_AVAILABLE = True
+except ImportError:
+    NUMEXPR_AVAILABLE = False
+
+# 行数超过该值时，多条件布尔筛选改用numexpr求值（小表上线程启动开销不划算）
+QUERY_MIN_ROWS = 50_000
+
+_CMP_OPS = {
+    ast.Gt: '>',
+    ast.GtE: '>=',
+    ast.Lt: '<',
+    ast.LtE: '<=',
+    ast.Eq: '==',
+    ast.NotEq: '!=',
+}
+
+
+class _BoolFilterToQuery(ast.NodeTransformer):
+    """
+    把 df[(df['a'] > 1) & (df['b'] < 5)] 这类“列与字面量比较”的多条件筛选改写为
+    (df.query("(`a` > 1) and (`b` < 5)", engine='numexpr') if len(df) > QUERY_MIN_ROWS else 原表达式)
+    
+    numexpr一次遍历完成所有条件，不再为每个子条件分配完整的布尔掩码；
+    无法完整翻译的表达式保持原样。
+    """
+    
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.value, ast.Name) or not isinstance(node.ctx, ast.Load):
+            return node
+        frame = node.value.id
+        # 至少两个条件才值得改写
+        if not (isinstance(node.slice, ast.BinOp) and isinstance(node.slice.op, (ast.BitAnd, ast.BitOr))):
+            return node
+        expr = self._to_query(node.slice, frame)
+        if expr is None:
+            return node
+        
+        query_call = ast.Call(
+            func=ast.Attribute(value=ast.Name(frame, ast.Load()), attr='query', ctx=ast.Load()),
+            args=[ast.Constant(expr)],
+            keywords=[ast.keyword('engine', ast.Constant('numexpr'))]
+        )
+        is_large = ast.Compare(
+            left=ast.Call(ast.Name('len', ast.Load()), [ast.Name(frame, ast.Load())], []),
+            ops=[ast.Gt()],
+            comparators=[ast.Constant(QUERY_MIN_ROWS)]
+        )
+        return ast.copy_location(ast.IfExp(test=is_large, body=query_call, orelse=node), node)
+    
+    def _to_query(self, node, frame: str) -> Optional[str]:
+        """把 & / | 连接的比较表达式翻译为query字符串，无法翻译时返回None"""
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            left = self._to_query(node.left, frame)
+            right = self._to_query(node.right, frame)
+            if left is None or right is None:
+                return None
+            op = 'and' if isinstance(node.op, ast.BitAnd) else 'or'
+            return f"({left}) {op} ({right})"
+        
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _CMP_OPS:
+            column = node.left
+            value = node.comparators[0]
+            if not (isinstance(column, ast.Subscript)
+                    and isinstance(column.value, ast.Name) and column.value.id == frame
+                    and isinstance(column.slice, ast.Constant) and isinstance(column.slice.value, str)
+                    and '`' not in column.slice.value):
+                return None
+            if not (isinstance(value, ast.Constant) and type(value.value) in (int, float, str)):
+                return None
+            return f"`{column.slice.value}` {_CMP_OPS[type(node.ops[0])]} {value.value!r}"
+        
+        return None
+
+
+class _ListStream(io.TextIOBase):
+    """收集输出片段的轻量流，只在取值时拼接一次，代替StringIO的反复扩容"""
+    
+    encoding = 'utf-8'
+    
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, s: str) -> int:
+        self.chunks.append(s)
+        return len(s)
+    
+    def getvalue(self) -> str:
+        return ''.join(self.chunks)
+
+
+@lru_cache(maxsize=256)
+def _compile(code: str):
+    """编译生成的代码，相同代码重复执行时跳过解析和编译"""
+    if not NUMEXPR_AVAILABLE:
+        return compile(code, '<generated>', 'exec')
+    tree = _BoolFilterToQuery().visit(ast.parse(code, '<generated>'))
+    ast.fix_missing_locations(tree)
+    return compile(tree, '<generated>', 'exec')
 
 
 class CodeExecutor:
     """代码执行器"""
     
+    # 执行环境的基础全局变量，导入时构建一次，每次执行时浅复制使用
+    _BASE_GLOBALS = {
+        'pd': pd,
+        'np': np,
+        'plt': plt,
+        'datetime': datetime.datetime,
+        '__builtins__': __builtins__
+    }
+    
     def __init__(self, file_path: str):
         """
         初始化代码执行器
@@ -27,51 +147,47 @@ class CodeExecutor:
         self.execution_error = None
         self.output_text = ""
     
-    def execute(self, code: str) -> Dict[str, Any]:
+    def execute(self, code: str, capture_output: bool = True) -> Dict[str, Any]:
         """
         执行Python代码
         
         Args:
             code: 要执行的Python代码字符串
+            capture_output: 是否捕获代码打印的输出；只需要result时可传False，
+                跳过stdout/stderr重定向
             
         Returns:
             执行结果字典，包含：
             - success: 是否成功
-            - output: 输出文本
+            - output: 输出文本（capture_output=False时为空）
             - result: 执行结果（如果有result变量）
             - error: 错误信息（如果有）
         """
-        # 准备执行环境
-        exec_globals = {
-            'pd': pd,
-            'np': __import__('numpy'),
-            'plt': __import__('matplotlib.pyplot'),
-            'datetime': __import__('datetime').datetime,
-            'file_path': self.file_path,  # 提供file_path变量供代码使用
-            '__builtins__': __builtins__
-        }
-        
-        # 捕获输出
-        stdout_capture = io.StringIO()
-        stderr_capture = io.StringIO()
+        # 每次执行使用独立的环境（浅复制基础全局变量），避免上一次执行留下的变量影响本次结果
+        exec_globals = {**self._BASE_GLOBALS, 'file_path': self.file_path}  # 提供file_path变量供代码使用
         
         try:
-            with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-                # 执行代码
-                exec(code, exec_globals)
-            
-            # 获取输出
-            stdout_text = stdout_capture.getvalue()
-            stderr_text = stderr_capture.getvalue()
+            if capture_output:
+                # 捕获输出
+                stdout_capture = _ListStream()
+                stderr_capture = _ListStream()
+                
+                with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
+                    # 执行代码
+                    exec(_compile(code), exec_globals)
+                
+                # 组合输出
+                output = stdout_capture.getvalue()
+                stderr_text = stderr_capture.getvalue()
+                if stderr_text:
+                    output += f"\n警告:\n{stderr_text}"
+            else:
+                exec(_compile(code), exec_globals)
+                output = ""
             
             # 获取result变量（如果存在）
             result = exec_globals.get('result', None)
             
-            # 组合输出
-            output = stdout_text
-            if stderr_text:
-                output += f"\n警告:\n{stderr_text}"
-            
             self.output_text = output
             self.execution_result = result
             self.execution_error = None
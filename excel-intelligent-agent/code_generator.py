@@ -1,15 +1,83 @@
 """
 代码生成模块 - 使用LLM生成Python数据分析代码
 """
+import hashlib
 import logging
 import os
-from typing import Dict, List, Optional
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from string import Template
+from typing import Dict, List, Optional, Tuple
 
+import orjson
 import pandas as pd
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# 规则生成的代码模板，模块加载时构建一次
+_RULES_CODE_TEMPLATE = Template("""# 数据分析
+import pandas as pd
+import numpy as np
+
+# 读取数据
+df = pd.read_excel(file_path)
+
+# 基本统计
+print("数据形状:", df.shape)
+print("\\n列名:", list(df.columns))
+print("\\n前5行数据:")
+print(df.head())
+
+# 创建结果字典
+result = {
+    'type': ${intent_type},
+    'answer': '数据分析完成',
+    'data': df.head(10).to_dict('records')
+}
+""")
+
+
+@lru_cache(maxsize=64)
+def _column_literal_pattern(columns: Tuple[str, ...]) -> "re.Pattern":
+    """编译匹配 '列名' / "列名" 的多选正则（长列名优先），同一组列名只编译一次"""
+    alternation = '|'.join(re.escape(col) for col in sorted(set(columns), key=len, reverse=True))
+    return re.compile(r"""(['"])(""" + alternation + r""")\1""")
+
+
+class _TTLCache:
+    """带过期时间的LRU缓存"""
+    
+    def __init__(self, maxsize: int = 256, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
 
 class CodeGenerator:
     """使用OpenAI生成Python代码进行Excel数据分析"""
@@ -23,6 +91,10 @@ class CodeGenerator:
         """
         self.openai_client = openai_client
         self.used_columns = []
+        # schema缓存：(id(df), 文件路径, 形状) -> schema
+        self._schema_cache: Dict[tuple, Dict] = {}
+        # LLM生成代码的缓存：(意图, 文件, 表结构指纹) -> (代码, 使用的列)
+        self._code_cache = _TTLCache(maxsize=256, ttl=3600)
     
     def generate_code(self, intent: Dict, file_path: str, df: pd.DataFrame) -> str:
         """
@@ -46,7 +118,27 @@ class CodeGenerator:
     
     def _generate_code_with_llm(self, intent: Dict, file_path: str, df: pd.DataFrame) -> str:
         """使用LLM生成代码"""
+        code, used_columns = self._llm_code(intent, file_path, df)
+        if used_columns is not None:
+            self.used_columns = used_columns
+        return code
+    
+    def _llm_code(self, intent: Dict, file_path: str, df: pd.DataFrame) -> Tuple[str, Optional[List[str]]]:
+        """
+        使用LLM生成代码，不修改实例上的used_columns，可在多个线程中并发调用
+        
+        Returns:
+            (代码, 使用的列名)；LLM失败回退到规则生成时列名为None
+        """
         try:
+            # 相同问题、相同表结构直接复用之前生成的代码，跳过API调用
+            cache_key = self._code_cache_key(intent, file_path, df)
+            cached = self._code_cache.get(cache_key)
+            if cached is not None:
+                code, used_columns = cached
+                logger.info("命中代码缓存，跳过LLM调用")
+                return code, list(used_columns)
+            
             # 构建schema信息
             schema = self._build_schema(df, file_path)
             
@@ -67,14 +159,62 @@ class CodeGenerator:
             code = self._format_code_response(code)
             
             # 从生成的代码中提取使用的列名（简单启发式方法）
-            self._extract_used_columns_from_code(code, df)
+            used_columns = self._find_used_columns(code, df)
             
-            return code
+            self._code_cache.set(cache_key, (code, list(used_columns)))
+            return code, used_columns
             
         except Exception as e:
             logger.error(f"LLM代码生成失败: {e}", exc_info=True)
             logger.info("回退到规则生成")
-            return self._generate_code_with_rules(intent, file_path, df)
+            return self._generate_code_with_rules(intent, file_path, df), None
+    
+    def generate_code_batch(self, requests: List[Tuple[Dict, str, pd.DataFrame]],
+                            max_workers: int = 4) -> List[Tuple[str, List[str]]]:
+        """
+        批量生成代码（如批量生成报告），各请求的LLM调用并发进行，网络往返相互重叠
+        
+        Args:
+            requests: (意图, 文件路径, DataFrame) 列表
+            max_workers: 最大并发请求数
+            
+        Returns:
+            与requests顺序一致的 (代码, 使用的列名) 列表；命中缓存的请求不访问网络
+        """
+        if not self.openai_client:
+            return [(self._generate_code_with_rules(*request), []) for request in requests]
+        
+        def run(request):
+            code, used_columns = self._llm_code(*request)
+            return code, used_columns or []
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(run, requests))
+    
+    def _code_cache_key(self, intent: Dict, file_path: str, df: pd.DataFrame) -> str:
+        """
+        计算代码缓存键：把决定提示词的各个片段（问题、意图、目标列、关键词、文件、
+        列名/类型、行数）依次送入blake2b，不拼接完整字符串
+        """
+        h = hashlib.blake2b(digest_size=16)
+        parts = (
+            intent.get('original_query', intent.get('operation', '数据分析')),
+            intent.get('intent', 'general_analysis'),
+            intent.get('target_columns', []),
+            intent.get('keywords', []),
+            file_path,
+            len(df),
+        )
+        for part in parts:
+            # orjson直接输出bytes，省去repr/str再encode的中间字符串
+            h.update(orjson.dumps(part, default=str))
+            h.update(b'\x1f')
+        for col, dtype in zip(df.columns, df.dtypes):
+            h.update(str(col).encode('utf-8'))
+            h.update(b'\x1e')
+            h.update(str(dtype).encode('utf-8'))
+            h.update(b'\x1f')
+        return h.hexdigest()
     
     def _get_system_prompt(self) -> str:
         """获取系统提示词"""
@@ -197,7 +337,17 @@ class CodeGenerator:
 '''
     
     def _build_schema(self, df: pd.DataFrame, file_path: str) -> Dict:
-        """从DataFrame构建schema信息"""
+        """从DataFrame构建schema信息（按DataFrame对象缓存，同一文件的多次提问只构建一次）"""
+        key = (id(df), file_path, df.shape)
+        schema = self._schema_cache.get(key)
+        if schema is None:
+            schema = self._schema_cache[key] = self._compute_schema(df, file_path)
+            # DataFrame被回收（如重新加载文件）时清除对应缓存，避免id被复用后命中旧结构
+            weakref.finalize(df, self._schema_cache.pop, key, None)
+        return schema
+    
+    def _compute_schema(self, df: pd.DataFrame, file_path: str) -> Dict:
+        """构建schema信息"""
         schema = {
             'file_name': os.path.basename(file_path),
             'total_rows': len(df),
@@ -206,11 +356,16 @@ class CodeGenerator:
             'column_types': {}
         }
         
-        # 获取列类型信息
-        for col in df.columns:
-            dtype = df[col].dtype
-            readable_type = self._get_readable_type(dtype)
-            sample_values = df[col].dropna().head(3).tolist()
+        # 获取列类型信息：每种dtype只判断一次可读类型，宽表不再逐列做pandas类型判断
+        dtypes = df.dtypes
+        readable_by_dtype = {dtype: self._get_readable_type(dtype) for dtype in set(dtypes)}
+        # 样例值先在前20行里找，不足3个时才扫描整列
+        head = df.head(20)
+        for col, dtype in zip(df.columns, dtypes):
+            readable_type = readable_by_dtype[dtype]
+            sample_values = head[col].dropna().head(3).to_numpy().tolist()
+            if len(sample_values) < 3:
+                sample_values = df[col].dropna().head(3).to_numpy().tolist()
             
             schema['column_types'][col] = {
                 'dtype': str(dtype),
@@ -218,10 +373,10 @@ class CodeGenerator:
                 'sample_values': sample_values
             }
         
-        # 获取前5行和后5行数据
+        # 获取前5行和后5行数据（按行的值元组，与headers按位置对应）
         if len(df) > 0:
-            schema['first_5_rows'] = df.head(5).to_dict('records')
-            schema['last_5_rows'] = df.tail(5).to_dict('records')
+            schema['first_5_rows'] = list(df.head(5).itertuples(index=False, name=None))
+            schema['last_5_rows'] = list(df.tail(5).itertuples(index=False, name=None))
         else:
             schema['first_5_rows'] = []
             schema['last_5_rows'] = []
@@ -258,18 +413,19 @@ class CodeGenerator:
             readable_type = col_type.get('readable_type', 'unknown')
             schema_lines.append(f"  - {header} ({readable_type})")
         
+        headers = schema.get('headers', [])
         if schema.get('first_5_rows'):
             schema_lines.append("")
             schema_lines.append("First 5 rows (sample data):")
             for i, row in enumerate(schema['first_5_rows'], 1):
-                row_str = ", ".join([f"{k}: {v}" for k, v in row.items()])
+                row_str = ", ".join([f"{k}: {v}" for k, v in zip(headers, row)])
                 schema_lines.append(f"  Row {i}: {row_str}")
         
         if schema.get('last_5_rows'):
             schema_lines.append("")
             schema_lines.append("Last 5 rows (sample data):")
             for i, row in enumerate(schema['last_5_rows'], 1):
-                row_str = ", ".join([f"{k}: {v}" for k, v in row.items()])
+                row_str = ", ".join([f"{k}: {v}" for k, v in zip(headers, row)])
                 schema_lines.append(f"  Row {i}: {row_str}")
         
         schema_text = "\n".join(schema_lines)
@@ -330,16 +486,19 @@ Important:
     
     def _extract_used_columns_from_code(self, code: str, df: pd.DataFrame) -> None:
         """从生成的代码中提取使用的列名（简单启发式方法）"""
-        used_cols = []
+        self.used_columns = self._find_used_columns(code, df)
+    
+    def _find_used_columns(self, code: str, df: pd.DataFrame) -> List:
+        """返回代码中以字符串字面量形式出现（'列名' 或 "列名"）的列名，按DataFrame列顺序"""
         available_cols = list(df.columns)
+        if not available_cols:
+            return []
         
-        # 查找代码中出现的列名
-        for col in available_cols:
-            # 检查列名是否在代码中出现（作为字符串字面量）
-            if f"'{col}'" in code or f'"{col}"' in code or f"df['{col}']" in code or f'df["{col}"]' in code:
-                used_cols.append(col)
+        # 一次扫描找出所有列名字面量
+        pattern = _column_literal_pattern(tuple(str(col) for col in available_cols))
+        found = {match.group(2) for match in pattern.finditer(code)}
         
-        self.used_columns = used_cols
+        return [col for col in available_cols if str(col) in found]
     
     def get_used_columns(self) -> List[str]:
         """获取使用的列名"""
@@ -353,24 +512,5 @@ Important:
         keywords = intent.get('keywords', [])
         
         # 简单的规则生成逻辑
-        code = f"""# 数据分析
-import pandas as pd
-import numpy as np
-
-# 读取数据
-df = pd.read_excel(file_path)
-
-# 基本统计
-print("数据形状:", df.shape)
-print("\\n列名:", list(df.columns))
-print("\\n前5行数据:")
-print(df.head())
-
-# 创建结果字典
-result = {{
-    'type': '{intent_type}',
-    'answer': '数据分析完成',
-    'data': df.head(10).to_dict('records')
-}}
-"""
+        code = _RULES_CODE_TEMPLATE.substitute(intent_type=repr(intent_type))
         return code
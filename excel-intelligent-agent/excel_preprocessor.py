@@ -6,20 +6,151 @@ import hashlib
 import json
 import logging
 import os
+import sys
+import threading
 import uuid
 from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, Tuple, Optional
 
+import orjson
 import pandas as pd
 import numpy as np
 import openpyxl
 from openpyxl.utils import get_column_letter
 
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# 读取Excel使用的引擎：安装了python-calamine时使用Rust实现的calamine，否则使用pandas默认引擎
+READ_ENGINE = 'calamine' if CALAMINE_AVAILABLE else None
+
+# 知识库中识别的Excel文件扩展名（小写比较）；calamine还能读取xlsb和ods
+EXCEL_EXTENSIONS = ('.xlsx', '.xls', '.xlsb', '.ods') if CALAMINE_AVAILABLE else ('.xlsx', '.xls')
+
+# xlsxwriter写出中间文件的选项：逐行流式写出，字符串原样写入（不转换为公式/链接）
+XLSXWRITER_OPTIONS = {
+    'constant_memory': True,
+    'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    'strings_to_formulas': False,
+    'strings_to_urls': False,
+    'nan_inf_to_errors': True,
+}
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# dtype -> 驻留的dtype名称；实际出现的dtype种类很少，各文件元数据共享同一批字符串对象
+_DTYPE_NAMES: Dict[object, str] = {}
+
+
+def _dtype_name(dtype) -> str:
+    """返回dtype的字符串名称（相同名称共享一个驻留字符串）"""
+    if isinstance(dtype, pd.CategoricalDtype):
+        # 类别型dtype的哈希依赖具体类别，不放入缓存
+        return 'category'
+    name = _DTYPE_NAMES.get(dtype)
+    if name is None:
+        name = _DTYPE_NAMES[dtype] = sys.intern(str(dtype))
+    return name
+
+
+class _LazyFrames(MutableMapping):
+    """
+    文件名 -> DataFrame 的映射
+    
+    通过register登记的文件只记录路径，首次按文件名取值时才调用loader解析；
+    in / len / 遍历文件名都不会触发解析
+    """
+    
+    def __init__(self, loader: Callable[[str, str], None]):
+        """
+        Args:
+            loader: loader(文件名, 文件路径)，负责解析文件并写回本映射
+        """
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._pending: Dict[str, str] = {}
+        self._loader = loader
+        # 可重入：loader在持锁期间会回写本映射
+        self._lock = threading.RLock()
+    
+    def register(self, file_name: str, file_path: str) -> None:
+        """登记待加载的文件（替换已加载的旧数据）"""
+        with self._lock:
+            self._frames.pop(file_name, None)
+            self._pending[file_name] = file_path
+    
+    def is_pending(self, file_name: str) -> bool:
+        """文件是否已登记但尚未解析"""
+        return file_name in self._pending
+    
+    def __getitem__(self, file_name: str) -> pd.DataFrame:
+        df = self._frames.get(file_name)
+        if df is not None:
+            return df
+        with self._lock:
+            file_path = self._pending.pop(file_name, None)
+            if file_path is not None:
+                self._loader(file_name, file_path)
+            return self._frames[file_name]
+    
+    def __setitem__(self, file_name: str, df: pd.DataFrame) -> None:
+        with self._lock:
+            self._frames[file_name] = df
+            self._pending.pop(file_name, None)
+    
+    def __delitem__(self, file_name: str) -> None:
+        with self._lock:
+            found = self._frames.pop(file_name, None) is not None
+            found = self._pending.pop(file_name, None) is not None or found
+        if not found:
+            raise KeyError(file_name)
+    
+    def pop(self, file_name: str, *default):
+        """移除文件，未解析的文件不会为此被解析"""
+        with self._lock:
+            df = self._frames.pop(file_name, None)
+            if self._pending.pop(file_name, None) is None and df is None:
+                if default:
+                    return default[0]
+                raise KeyError(file_name)
+        return df
+    
+    def __contains__(self, file_name) -> bool:
+        return file_name in self._frames or file_name in self._pending
+    
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            names = list(self._frames) + list(self._pending)
+        return iter(names)
+    
+    def __len__(self) -> int:
+        return len(self._frames) + len(self._pending)
+
 
 class ExcelPreprocessor:
     """Excel文件预处理器，支持复杂表头结构"""
@@ -36,108 +167,204 @@ class ExcelPreprocessor:
         self.knowledge_base_path = knowledge_base_path
         self.openai_client = openai_client
         self.use_llm_analysis = use_llm_analysis
-        self.processed_files: Dict[str, pd.DataFrame] = {}
+        # 惰性加载的文件在首次访问processed_files[文件名]时才解析
+        self.processed_files: _LazyFrames = _LazyFrames(self._load_pending)
         self.file_metadata: Dict[str, Dict] = {}
+        # 文件名 -> 加载时的(源文件修改时间, 文件大小, 是否使用LLM分析, 指定的sheet)，用于重新加载时跳过未变化的文件
+        self._load_signatures: Dict[str, Tuple[float, int, bool, Optional[str]]] = {}
+        # 文件名 -> 小写的"文件名\x00列名"搜索文本，加载时生成一次供关键词搜索复用
+        # （不放进file_metadata，避免随文件信息返回给前端）
+        self._search_blobs: Dict[str, str] = {}
+        # 原始文件绝对路径 -> 最近一次使用的重建文件路径，源文件内容变化后只删除它自己的旧重建文件
+        self._reconstructed_paths: Dict[str, str] = {}
+        self._reconstructed_lock = threading.Lock()
+        # 并行加载时保证每个文件的表头信息整块输出
+        self._print_lock = threading.Lock()
         
         # 临时目录用于存储重建的文件
         self.temp_dir = Path(knowledge_base_path) / ".reconstructed"
         self.temp_dir.mkdir(exist_ok=True)
         
+        # 预处理结果的Parquet缓存目录，重启时未变化的文件直接读取缓存（需要pyarrow）
+        self.cache_dir = Path(knowledge_base_path) / ".cache"
+        
         # 确保知识库目录存在
         os.makedirs(knowledge_base_path, exist_ok=True)
     
-    def load_excel_file(self, file_path: str) -> pd.DataFrame:
+    def load_excel_file(self, file_path: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
         """
         加载Excel文件并重塑为二维表
         支持复杂表头结构的处理
         
         Args:
             file_path: Excel文件路径
+            sheet_name: 要读取的工作表名；为None时读取数据最多的工作表
             
         Returns:
             处理后的DataFrame
         """
         try:
             file_name = os.path.basename(file_path)
+            signature = self._file_signature(file_path, sheet_name)
             
             # 实际用于分析的数据文件路径（默认是原始文件）
             actual_data_path = file_path
             
+            # 源文件和处理方式都未变化时，直接使用上次预处理结果的Parquet缓存
+            cached_df = self._read_parquet_cache(file_name, signature)
+            if cached_df is not None:
+                df = cached_df
+                actual_data_path = df.attrs.get('file_path', file_path)
             # 如果使用LLM分析且OpenAI客户端可用，使用复杂处理流程
-            if self.use_llm_analysis and self.openai_client:
+            elif self.use_llm_analysis and self.openai_client:
                 try:
                     logger.info(f"使用LLM分析处理文件: {file_name}")
                     processed_file = self._process_with_llm(file_path)
                     if processed_file and os.path.exists(processed_file):
                         # 从处理后的文件读取
-                        df = self._read_processed_file(processed_file)
+                        df = self._read_processed_file(processed_file, sheet_name)
                         # 对于后续分析和代码执行，应使用重建后的文件路径
                         actual_data_path = processed_file
                     else:
                         # 回退到简单处理
                         logger.warning(f"LLM处理失败，使用简单处理: {file_name}")
-                        df = self._simple_load(file_path)
+                        df = self._simple_load(file_path, sheet_name)
                 except Exception as e:
                     logger.warning(f"LLM处理出错，使用简单处理: {file_name}, 错误: {str(e)}")
-                    df = self._simple_load(file_path)
+                    df = self._simple_load(file_path, sheet_name)
             else:
                 # 使用简单处理
-                df = self._simple_load(file_path)
+                df = self._simple_load(file_path, sheet_name)
             
-            # 重塑为二维表：清理空行空列，重置索引
-            df = self._reshape_to_2d(df)
+            if cached_df is None:
+                # 重塑为二维表：清理空行空列，重置索引
+                df = self._reshape_to_2d(df)
+                
+                # 压缩列类型，降低常驻内存
+                df = self._compact_dtypes(df)
             
             # 打印预处理后的表头信息
             self._print_preprocessed_headers(file_name, df)
             
-            # 存储处理后的数据
-            self.processed_files[file_name] = df
             # 将实际用于分析的数据文件路径放入DataFrame属性，作为额外保险
             df.attrs['file_path'] = actual_data_path
             
-            # 存储元数据
-            self.file_metadata[file_name] = {
-                # 这里的path用于后续代码执行，应指向实际的数据文件（重建后文件）
-                'path': actual_data_path,
-                'columns': list(df.columns),
-                'shape': df.shape,
-                'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}
-            }
+            # 存储处理后的数据和元数据
+            self._store_loaded(file_name, df, signature)
+            
+            if cached_df is None:
+                self._write_parquet_cache(file_name, df, signature)
             
             return df
             
         except Exception as e:
             raise Exception(f"加载Excel文件失败: {str(e)}")
     
-    def _simple_load(self, file_path: str) -> pd.DataFrame:
+    def _store_loaded(self, file_name: str, df: pd.DataFrame, signature: Tuple[float, int, bool, Optional[str]]) -> None:
         """
-        简单加载方法（原有逻辑）
+        保存加载完成的DataFrame及其元数据
         
         Args:
-            file_path: Excel文件路径
+            file_name: 源Excel文件名
+            df: 预处理后的DataFrame（attrs['file_path']为实际数据文件路径）
+            signature: 加载签名
+        """
+        actual_data_path = df.attrs['file_path']
+        self.processed_files[file_name] = df
+        
+        # 存储元数据
+        self.file_metadata[file_name] = {
+            # 这里的path用于后续代码执行，应指向实际的数据文件（重建后文件）
+            'path': actual_data_path,
+            'columns': list(df.columns),
+            'shape': df.shape,
+            'dtypes': {col: _dtype_name(dtype) for col, dtype in df.dtypes.items()}
+        }
+        self._load_signatures[file_name] = signature
+        self._search_blobs[file_name] = self._build_search_blob(file_name, df.columns)
+    
+    def _file_signature(self, file_path: str, sheet_name: Optional[str] = None,
+                        stat: Optional[os.stat_result] = None) -> Tuple[float, int, bool, Optional[str]]:
+        """源文件的加载签名：(修改时间, 文件大小, 是否使用LLM分析, 指定的sheet)，可传入已获取的stat"""
+        if stat is None:
+            stat = os.stat(file_path)
+        return (stat.st_mtime, stat.st_size, bool(self.use_llm_analysis and self.openai_client), sheet_name)
+    
+    def _read_parquet_cache(self, file_name: str, signature: Tuple[float, int, bool, Optional[str]]) -> Optional[pd.DataFrame]:
+        """
+        读取预处理结果的Parquet缓存
+        
+        Args:
+            file_name: 源Excel文件名
+            signature: 源文件的(修改时间, 文件大小, 是否使用LLM分析, 指定的sheet)
             
         Returns:
-            DataFrame
+            缓存有效时返回DataFrame，否则返回None
         """
-        excel_file = pd.ExcelFile(file_path)
-        sheets = excel_file.sheet_names
+        if not PYARROW_AVAILABLE:
+            return None
+        cache_path = self.cache_dir / f"{file_name}.parquet"
+        if not cache_path.exists():
+            return None
+        try:
+            df = pd.read_parquet(cache_path, engine='pyarrow')
+        except Exception as e:
+            logger.warning(f"读取缓存失败，重新解析: {file_name}, 错误: {str(e)}")
+            return None
         
-        # 如果只有一个sheet，直接读取（header=0表示第一行作为列名）
-        if len(sheets) == 1:
-            df = pd.read_excel(file_path, sheet_name=sheets[0], header=0)
-        else:
-            # 多个sheet时，尝试找到数据最多的sheet
-            max_rows = 0
-            best_sheet = sheets[0]
-            for sheet in sheets:
-                temp_df = pd.read_excel(file_path, sheet_name=sheet, header=0)
-                if len(temp_df) > max_rows:
-                    max_rows = len(temp_df)
-                    best_sheet = sheet
-            df = pd.read_excel(file_path, sheet_name=best_sheet, header=0)
+        if df.attrs.pop('cache_signature', None) != list(signature):
+            return None
+        # 重建文件被删除时缓存中的路径已失效
+        if not os.path.exists(df.attrs.get('file_path', '')):
+            return None
         
+        logger.info(f"使用Parquet缓存: {file_name}")
         return df
     
+    def _write_parquet_cache(self, file_name: str, df: pd.DataFrame, signature: Tuple[float, int, bool, Optional[str]]) -> None:
+        """把预处理结果写入Parquet缓存（失败时仅记录警告）"""
+        if not PYARROW_AVAILABLE:
+            return
+        try:
+            self.cache_dir.mkdir(exist_ok=True)
+            cached = df.copy(deep=False)
+            cached.attrs['cache_signature'] = list(signature)
+            cached.to_parquet(self.cache_dir / f"{file_name}.parquet", engine='pyarrow', compression='zstd')
+        except Exception as e:
+            logger.warning(f"写入缓存失败: {file_name}, 错误: {str(e)}")
+    
+    def _open_excel(self, file_path: str) -> pd.ExcelFile:
+        """
+        打开Excel文件，优先使用calamine引擎
+        
+        calamine无法解析的文件回退到pandas默认引擎（xlsx为openpyxl，xls为xlrd）
+        
+        Args:
+            file_path: Excel文件路径
+            
+        Returns:
+            pd.ExcelFile（同一个工作簿对象可用于读取多个sheet）
+        """
+        if READ_ENGINE is not None:
+            try:
+                return pd.ExcelFile(file_path, engine=READ_ENGINE)
+            except Exception as e:
+                logger.warning(f"calamine无法读取文件，回退到默认引擎: {os.path.basename(file_path)}, 错误: {str(e)}")
+        return pd.ExcelFile(file_path)
+    
+    def _simple_load(self, file_path: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
+        """
+        简单加载方法（原有逻辑）
+        
+        Args:
+            file_path: Excel文件路径
+            sheet_name: 指定的工作表名，为None时读取数据最多的工作表
+            
+        Returns:
+            DataFrame
+        """
+        return self._read_sheet(file_path, sheet_name)
+    
     def _process_with_llm(self, file_path: str) -> Optional[str]:
         """
         使用LLM处理复杂表头结构
@@ -149,24 +376,12 @@ class ExcelPreprocessor:
             处理后的文件路径，如果失败返回None
         """
         try:
-            # 检查是否已有处理后的文件
-            existing_recon = self._get_reconstructed_path(file_path)
-            if existing_recon and os.path.exists(existing_recon):
-                # 检查原始文件是否已修改
-                original_stat = Path(file_path).stat()
-                recon_stat = Path(existing_recon).stat()
-                
-                if original_stat.st_mtime <= recon_stat.st_mtime:
-                    logger.info(f"使用已存在的重建文件: {existing_recon}")
-                    return existing_recon
-                else:
-                    logger.info(f"原始文件已修改，重新生成...")
-                    os.remove(existing_recon)
-            
-            # 生成输出路径
-            original_name = Path(file_path).stem
-            file_hash = hashlib.md5(str(Path(file_path).absolute()).encode()).hexdigest()[:8]
-            output_path = self.temp_dir / f"{original_name}_reconstructed_{file_hash}.xlsx"
+            # 重建文件按原始文件内容命名：内容相同（包括移动/复制、仅修改时间变化）时直接复用
+            output_path = Path(self._get_reconstructed_path(file_path))
+            if output_path.exists():
+                logger.info(f"使用已存在的重建文件: {output_path}")
+                self._remember_reconstructed(file_path, str(output_path))
+                return str(output_path)
             
             logger.info(f"处理Excel文件: {file_path}")
             logger.info(f"重建文件将保存到: {output_path}")
@@ -181,10 +396,17 @@ class ExcelPreprocessor:
                 # Step 3: 自动处理（删除标签行，合并多级表头）
                 reconstructed_data = self._step3_automated_processing(unmerged_file, analysis_result)
                 
-                # 写入重建文件
-                self._write_reconstructed_file(reconstructed_data, output_path)
+                # 写入重建文件（先写临时文件再替换，避免中断时留下不完整的重建文件被复用）
+                tmp_path = self.temp_dir / f"tmp_{uuid.uuid4().hex[:8]}.xlsx"
+                try:
+                    self._write_reconstructed_file(reconstructed_data, tmp_path)
+                    os.replace(tmp_path, output_path)
+                finally:
+                    if tmp_path.exists():
+                        tmp_path.unlink()
                 
                 logger.info(f"Excel处理完成。重建文件: {output_path}")
+                self._remember_reconstructed(file_path, str(output_path))
                 return str(output_path)
                 
             finally:
@@ -204,7 +426,7 @@ class ExcelPreprocessor:
             file_path: 原始Excel文件路径
             
         Returns:
-            (取消合并后的文件路径, 合并信息字典)
+            (取消合并后的文件路径, 合并信息字典：工作表名 -> [(合并区域, 左上角单元格的值)])
         """
         try:
             logger.info("Step 1: 取消合并单元格并填充空白...")
@@ -212,6 +434,15 @@ class ExcelPreprocessor:
             # 创建临时文件
             unmerged_file = str(self.temp_dir / f"unmerged_{uuid.uuid4().hex[:8]}.xlsx")
             
+            # 优先用calamine读取 + xlsxwriter流式写出，失败时回退到openpyxl
+            if CALAMINE_AVAILABLE and XLSXWRITER_AVAILABLE:
+                try:
+                    merged_info = self._unmerge_and_fill_fast(file_path, unmerged_file)
+                    logger.info(f"Step 1 完成。取消合并文件: {os.path.basename(unmerged_file)}")
+                    return unmerged_file, merged_info
+                except Exception as e:
+                    logger.warning(f"快速取消合并失败，回退到openpyxl: {str(e)}")
+            
             # 加载工作簿
             wb = openpyxl.load_workbook(file_path, data_only=True)
             merged_info = {}
@@ -228,13 +459,8 @@ class ExcelPreprocessor:
                     )
                     value = ws.cell(row=min_row, column=min_col).value
                     
-                    # 存储合并信息
-                    sheet_merged_info.append({
-                        "range": str(merged_range),
-                        "start": (min_row, min_col),
-                        "end": (max_row, max_col),
-                        "value": value
-                    })
+                    # 存储合并信息：(合并区域, 值)，区域字符串已包含起止位置
+                    sheet_merged_info.append((str(merged_range), value))
                     
                     # 取消合并
                     ws.unmerge_cells(start_row=min_row, start_column=min_col,
@@ -259,6 +485,60 @@ class ExcelPreprocessor:
             logger.error(f"Step 1 (取消合并) 出错: {e}", exc_info=True)
             raise
     
+    def _unmerge_and_fill_fast(self, file_path: str, unmerged_file: str) -> Dict:
+        """
+        Step 1的快速实现：calamine读取单元格值和合并区域，xlsxwriter以constant_memory模式逐行写出，
+        合并区域内的单元格写入左上角的值
+        
+        Args:
+            file_path: 原始Excel文件路径
+            unmerged_file: 输出文件路径
+            
+        Returns:
+            合并信息字典（格式与openpyxl实现相同）
+        """
+        source = python_calamine.CalamineWorkbook.from_path(file_path)
+        merged_info = {}
+        
+        with xlsxwriter.Workbook(unmerged_file, XLSXWRITER_OPTIONS) as target:
+            for sheet_name in source.sheet_names:
+                logger.info(f"  处理工作表: {sheet_name}")
+                sheet = source.get_sheet_by_name(sheet_name)
+                # 从A1开始的完整区域，行列号即单元格坐标（0基），空单元格为''
+                rows = sheet.to_python(skip_empty_area=False)
+                
+                ranges = sheet.merged_cell_ranges or []
+                
+                # 整张表放入object数组（None为空），合并区域用切片一次性填充
+                n_rows = max([len(rows)] + [max_row + 1 for _, (max_row, _) in ranges])
+                n_cols = max([len(row) for row in rows] + [max_col + 1 for _, (_, max_col) in ranges] + [0])
+                cells = np.full((n_rows, n_cols), None, dtype=object)
+                for r, row in enumerate(rows):
+                    cells[r, :len(row)] = row
+                
+                sheet_merged_info = []
+                for (min_row, min_col), (max_row, max_col) in ranges:
+                    value = cells[min_row, min_col]
+                    if value == '':
+                        value = None
+                    sheet_merged_info.append((
+                        f"{get_column_letter(min_col + 1)}{min_row + 1}:{get_column_letter(max_col + 1)}{max_row + 1}",
+                        value
+                    ))
+                    if value is not None:
+                        cells[min_row:max_row + 1, min_col:max_col + 1] = value
+                
+                ws = target.add_worksheet(sheet_name)
+                for r, row in enumerate(cells.tolist()):
+                    for c, value in enumerate(row):
+                        if value is not None and value != '':
+                            ws.write(r, c, value)
+                
+                merged_info[sheet_name] = sheet_merged_info
+                logger.info(f"    取消合并了 {len(sheet_merged_info)} 个合并单元格范围")
+        
+        return merged_info
+    
     def _step2_model_analysis(self, unmerged_file: str, merged_info: Dict) -> List[Dict]:
         """
         Step 2: 模型分析 - 识别表头和标签行
@@ -272,11 +552,7 @@ class ExcelPreprocessor:
         """
         if self.openai_client is None:
             logger.warning("未提供OpenAI客户端，使用默认分析")
-            all_sheets = pd.read_excel(unmerged_file, sheet_name=None, header=None)
-            return [
-                {sheet_name: {"labels": [], "header": [1]}}
-                for sheet_name in all_sheets.keys()
-            ]
+            return self._default_analysis(unmerged_file)
         
         try:
             logger.info("Step 2: 模型分析 - 识别标签行和表头...")
@@ -284,8 +560,8 @@ class ExcelPreprocessor:
             # 提取前10行作为样本
             excel_info = self._get_excel_data(unmerged_file, head=10)
             
-            # 准备合并信息
-            merged_info_json = json.dumps(merged_info, ensure_ascii=False, indent=2)
+            # 准备合并信息：紧凑JSON（不缩进）减少提示词长度，日期等值由orjson直接序列化
+            merged_info_json = orjson.dumps(merged_info, default=str).decode()
             
             system_prompt = '''你是一个专业的结构化数据处理AI，专门分析Excel表格结构。
 
@@ -315,26 +591,30 @@ class ExcelPreprocessor:
 {excel_info}
 ```
 
-2. 原始合并单元格信息（用于确定表头级别）：
+2. 原始合并单元格信息（用于确定表头级别，每个工作表为 [合并区域, 值] 的列表）：
 
 ```
 {merged_info_json}
 ```
 
-输出格式：
+输出格式（JSON对象，"sheets"为每个工作表的分析结果列表）：
 
-[
-    {{
-        "sheet_name1": {{
-            "labels": [行号],    # 整个工作表的标签文本行（如果没有则为空列表）
-            "header": [行号]      # 多级表头行（必须包含至少1行）
+{{
+    "sheets": [
+        {{
+            "sheet_name1": {{
+                "labels": [行号],    # 整个工作表的标签文本行（如果没有则为空列表）
+                "header": [行号]      # 多级表头行（必须包含至少1行）
+            }}
         }},
-        "sheet_name2": {{
-            "labels": [行号],
-            "header": [行号]
+        {{
+            "sheet_name2": {{
+                "labels": [行号],
+                "header": [行号]
+            }}
         }}
-    }}
-]
+    ]
+}}
 
 关键指导原则：
 1. 表头是简短的标签（每个单元格1-5个词）。长文本 = 数据行，不是表头。
@@ -348,35 +628,44 @@ class ExcelPreprocessor:
 
 示例正确输出：
 
-[
-    {{"sheet_name1": {{
-        "labels": [1, 2],
-        "header": [3, 4, 5]
-    }}}},
-    {{"sheet_name2": {{
-        "labels": [],
-        "header": [1, 2]
-    }}}},
-    {{"sheet_name3": {{
-        "labels": [],
-        "header": [1]
-    }}}}
-]'''
+{{
+    "sheets": [
+        {{"sheet_name1": {{
+            "labels": [1, 2],
+            "header": [3, 4, 5]
+        }}}},
+        {{"sheet_name2": {{
+            "labels": [],
+            "header": [1, 2]
+        }}}},
+        {{"sheet_name3": {{
+            "labels": [],
+            "header": [1]
+        }}}}
+    ]
+}}'''
+            
+            # 提示词（含样本数据和合并信息）与模型都相同时直接复用上次的分析结果，不再调用LLM
+            model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+            cache_key = self._llm_cache_key(model, system_prompt, user_prompt)
+            cached_result = self._llm_cache_get(cache_key)
+            if cached_result is not None:
+                logger.info(f"Step 2 使用缓存的分析结果。分析了 {len(cached_result)} 个工作表")
+                return cached_result
             
             response = self.openai_client.chat.completions.create(
-                model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+                model=model,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                temperature=0.3
+                temperature=0.3,
+                # JSON模式：模型直接返回合法的JSON对象，无需清理markdown代码块
+                response_format={"type": "json_object"}
             )
             
-            result_text = response.choices[0].message.content.strip()
-            # 清理JSON（可能包含markdown代码块）
-            result_text = result_text.replace('```json', '').replace('```', '').strip()
-            
-            analysis_result = json.loads(result_text)
+            analysis_result = json.loads(response.choices[0].message.content)["sheets"]
+            self._llm_cache_put(cache_key, analysis_result)
             logger.info(f"Step 2 完成。分析了 {len(analysis_result)} 个工作表")
             
             return analysis_result
@@ -384,11 +673,52 @@ class ExcelPreprocessor:
         except Exception as e:
             logger.error(f"Step 2 (模型分析) 出错: {e}", exc_info=True)
             logger.info("回退到默认分析")
-            all_sheets = pd.read_excel(unmerged_file, sheet_name=None, header=None)
-            return [
-                {sheet_name: {"labels": [], "header": [1]}}
-                for sheet_name in all_sheets.keys()
-            ]
+            return self._default_analysis(unmerged_file)
+    
+    def _default_analysis(self, unmerged_file: str) -> List[Dict]:
+        """
+        默认分析结果：每个工作表无标签行，第1行为表头
+        
+        只需要工作表名，打开工作簿读取sheet列表，不解析单元格数据
+        """
+        with self._open_excel(unmerged_file) as excel_file:
+            sheet_names = excel_file.sheet_names
+        return [
+            {sheet_name: {"labels": [], "header": [1]}}
+            for sheet_name in sheet_names
+        ]
+    
+    def _llm_cache_key(self, model: str, *parts: str) -> str:
+        """Step 2缓存键：模型名与提示词的sha256"""
+        h = hashlib.sha256(model.encode())
+        for part in parts:
+            h.update(b'\x00')
+            h.update(part.encode())
+        return h.hexdigest()
+    
+    def _llm_cache_get(self, key: str):
+        """读取缓存的LLM分析结果，不存在或损坏时返回None"""
+        cache_path = self.temp_dir / ".llm_cache" / f"{key}.json"
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取LLM分析缓存失败: {str(e)}")
+            return None
+    
+    def _llm_cache_put(self, key: str, result) -> None:
+        """保存LLM分析结果（失败时仅记录警告）"""
+        cache_dir = self.temp_dir / ".llm_cache"
+        try:
+            cache_dir.mkdir(exist_ok=True)
+            tmp_path = cache_dir / f"{key}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_dir / f"{key}.json")
+        except Exception as e:
+            logger.warning(f"写入LLM分析缓存失败: {str(e)}")
     
     def _step3_automated_processing(self, unmerged_file: str, analysis_result: List[Dict]) -> Dict:
         """
@@ -416,7 +746,7 @@ class ExcelPreprocessor:
                     logger.info(f"    表头行: {header}")
                     
                     # Step 3.1: 先删除标签行（在读取表头之前）
-                    df_raw = pd.read_excel(unmerged_file, sheet_name=sheet_name, header=None, dtype=object)
+                    df_raw = pd.read_excel(unmerged_file, sheet_name=sheet_name, header=None, dtype=object, engine=READ_ENGINE)
                     
                     if labels:
                         # 转换为0基索引并删除标签行
@@ -475,7 +805,8 @@ class ExcelPreprocessor:
             格式化的字符串，包含工作表信息
         """
         try:
-            all_sheets_data = pd.read_excel(file_path, sheet_name=None, header=None)
+            # 只解析每个工作表的前head行
+            all_sheets_data = pd.read_excel(file_path, sheet_name=None, header=None, nrows=head, engine=READ_ENGINE)
             prompt_parts = []
             
             for sheet_name, data in all_sheets_data.items():
@@ -483,8 +814,8 @@ class ExcelPreprocessor:
                 excel_col_names = [get_column_letter(i + 1) for i in range(len(data.columns))]
                 data.columns = excel_col_names
                 
-                # 替换字符串中的换行符
-                data = data.map(lambda x: str(x).replace('\n', ' ') if isinstance(x, str) else x)
+                # 替换字符串中的换行符（只作用于字符串值，数字/日期保持不变）
+                data = data.replace('\n', ' ', regex=True)
                 
                 # 使用to_string代替to_markdown，避免依赖tabulate
                 try:
@@ -513,6 +844,14 @@ class ExcelPreprocessor:
         try:
             logger.info(f"写入重建文件: {output_path}")
             
+            if XLSXWRITER_AVAILABLE:
+                try:
+                    self._write_reconstructed_file_fast(reconstructed_data, output_path)
+                    logger.info(f"重建文件保存成功")
+                    return
+                except Exception as e:
+                    logger.warning(f"流式写入失败，回退到openpyxl: {str(e)}")
+            
             with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
                 for sheet_name, df in reconstructed_data.items():
                     df.to_excel(writer, sheet_name=sheet_name, index=False)
@@ -524,49 +863,147 @@ class ExcelPreprocessor:
             logger.error(f"写入重建文件时出错: {e}", exc_info=True)
             raise
     
-    def _get_reconstructed_path(self, original_path: str) -> Optional[str]:
+    def _write_reconstructed_file_fast(self, reconstructed_data: Dict, output_path: Path) -> None:
+        """
+        用xlsxwriter的constant_memory模式逐行写出重建数据
+        
+        pandas的to_excel按列生成单元格，与constant_memory模式（只保留当前行）不兼容，
+        因此这里直接按行写出：第一行为列名，空值不写入
+        """
+        with xlsxwriter.Workbook(str(output_path), XLSXWRITER_OPTIONS) as workbook:
+            for sheet_name, df in reconstructed_data.items():
+                ws = workbook.add_worksheet(sheet_name)
+                for c, col in enumerate(df.columns):
+                    ws.write(0, c, col)
+                for r, row in enumerate(df.itertuples(index=False, name=None), start=1):
+                    for c, value in enumerate(row):
+                        if not pd.isna(value):
+                            ws.write(r, c, value)
+                logger.info(f"  - 工作表 '{sheet_name}': {len(df)} 行 × {len(df.columns)} 列")
+    
+    def _get_reconstructed_path(self, original_path: str) -> str:
         """
-        获取重建文件路径（如果存在）
+        获取重建文件路径：{原文件名}_reconstructed_{内容指纹}.xlsx
         
         Args:
             original_path: 原始文件路径
             
         Returns:
-            重建文件路径，如果不存在则返回None
+            重建文件路径（文件不一定存在）
         """
         original_name = Path(original_path).stem
+        return str(self.temp_dir / f"{original_name}_reconstructed_{self._file_fingerprint(original_path)}.xlsx")
+    
+    def _remember_reconstructed(self, original_path: str, output_path: str) -> None:
+        """
+        记录原始文件当前对应的重建文件，并删除同一原始文件之前的重建文件
+        （其他原始文件仍在使用的重建文件不删除）
         
-        # 查找现有的重建文件
-        for file in self.temp_dir.glob(f"{original_name}_reconstructed_*.xlsx"):
-            return str(file)
-        
-        return None
+        Args:
+            original_path: 原始文件路径
+            output_path: 当前的重建文件路径
+        """
+        source = os.path.abspath(original_path)
+        with self._reconstructed_lock:
+            stale = self._reconstructed_paths.get(source)
+            self._reconstructed_paths[source] = output_path
+            if stale is None or stale == output_path or stale in self._reconstructed_paths.values():
+                return
+        logger.info(f"原始文件已修改，删除旧的重建文件: {os.path.basename(stale)}")
+        Path(stale).unlink(missing_ok=True)
     
-    def _read_processed_file(self, processed_file: str) -> pd.DataFrame:
+    @staticmethod
+    def _file_fingerprint(file_path: str) -> str:
+        """文件内容的blake2b指纹（分块读取整个文件）"""
+        h = hashlib.blake2b(digest_size=8)
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+    
+    def _read_processed_file(self, processed_file: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
         """
         从处理后的文件读取数据
         
         Args:
             processed_file: 处理后的文件路径
+            sheet_name: 指定的工作表名，为None时读取数据最多的工作表
+            
+        Returns:
+            DataFrame
+        """
+        return self._read_sheet(processed_file, sheet_name)
+    
+    def _read_sheet(self, file_path: str, sheet_name: Optional[str]) -> pd.DataFrame:
+        """
+        读取指定的sheet（第一行作为列名），未指定时读取数据最多的sheet
+        
+        指定sheet时不探测其它sheet的尺寸
+        """
+        if sheet_name is None:
+            return self._read_largest_sheet(file_path)
+        with self._open_excel(file_path) as excel_file:
+            return excel_file.parse(sheet_name=sheet_name, header=0)
+    
+    def _read_largest_sheet(self, file_path: str) -> pd.DataFrame:
+        """
+        读取数据最多的sheet（第一行作为列名）
+        
+        多个sheet时根据工作簿记录的sheet尺寸选择，只解析选中的sheet一次
+        
+        Args:
+            file_path: Excel文件路径
             
         Returns:
             DataFrame
         """
-        excel_file = pd.ExcelFile(processed_file)
+        with self._open_excel(file_path) as excel_file:
+            sheets = excel_file.sheet_names
+            
+            best_sheet = sheets[0] if len(sheets) == 1 else self._largest_sheet(excel_file)
+            if best_sheet is not None:
+                return excel_file.parse(sheet_name=best_sheet, header=0)
+            
+            # 引擎无法提供尺寸时，逐个解析并保留行数最多的结果
+            best_df = None
+            for sheet in excel_file.sheet_names:
+                temp_df = excel_file.parse(sheet_name=sheet, header=0)
+                if best_df is None or len(temp_df) > len(best_df):
+                    best_df = temp_df
+            return best_df
+    
+    def _largest_sheet(self, excel_file: pd.ExcelFile) -> Optional[str]:
+        """
+        根据工作簿记录的尺寸找出行数最多的sheet（行数相同时取靠前的sheet）
+        
+        Returns:
+            sheet名，引擎无法提供尺寸时返回None
+        """
         sheets = excel_file.sheet_names
+        heights = [self._sheet_height(excel_file, sheet) for sheet in sheets]
+        if None in heights:
+            return None
+        return sheets[heights.index(max(heights))]
+    
+    def _sheet_height(self, excel_file: pd.ExcelFile, sheet: str) -> Optional[int]:
+        """
+        从工作簿元数据获取sheet的行数（不构建DataFrame）
         
-        # 选择数据最多的sheet
-        if len(sheets) == 1:
-            return pd.read_excel(processed_file, sheet_name=sheets[0], header=0)
-        else:
-            max_rows = 0
-            best_sheet = sheets[0]
-            for sheet in sheets:
-                temp_df = pd.read_excel(processed_file, sheet_name=sheet, header=0)
-                if len(temp_df) > max_rows:
-                    max_rows = len(temp_df)
-                    best_sheet = sheet
-            return pd.read_excel(processed_file, sheet_name=best_sheet, header=0)
+        Args:
+            excel_file: 已打开的ExcelFile
+            sheet: 工作表名
+            
+        Returns:
+            行数，引擎不支持或尺寸未知时返回None
+        """
+        book = excel_file.book
+        if excel_file.engine == 'calamine':
+            return book.get_sheet_by_name(sheet).height
+        if excel_file.engine == 'openpyxl':
+            return book[sheet].max_row
+        if excel_file.engine == 'xlrd':
+            return book.sheet_by_name(sheet).nrows
+        return None
     
     def _adjust_header_indices(self, header: List[int], labels: List[int], df_length: int) -> Optional[List[int]]:
         """
@@ -619,28 +1056,31 @@ class ExcelPreprocessor:
                 df.columns = [f'Column_{i}' for i in range(len(df.columns))]
                 return df
             
-            df_raw.columns = df_raw.iloc[header_idx]
             data_start = header_idx + 1
             
             if data_start < len(df_raw):
-                return df_raw.iloc[data_start:].reset_index(drop=True)
+                # 原始数据按object读取，直接切分底层数组，只构建一次DataFrame
+                values = df_raw.to_numpy()
+                return pd.DataFrame(values[data_start:], columns=values[header_idx], dtype=object, copy=False)
             else:
                 # 表头后没有数据行
                 return pd.DataFrame(columns=df_raw.iloc[header_idx])
         else:
             # 多级表头：合并为单行
-            header_rows_data = df_raw.iloc[header_0_based]
-            new_columns = []
+            values = df_raw.to_numpy()
+            header_values = values[header_0_based]
+            
+            # 一次性计算所有表头单元格的字符串和筛选条件：非空、非'Unnamed'、
+            # 只包含短值（可能是表头，不是数据；表头通常很短）
+            not_na = ~pd.isna(header_values)
+            header_strs = np.where(not_na, header_values, '').astype(str)
+            stripped = np.char.strip(header_strs)
+            lengths = np.char.str_len(stripped)
+            keep = not_na & (lengths > 0) & (lengths <= 50) & (np.char.find(header_strs, 'Unnamed') < 0)
             
-            for col_idx in range(len(df_raw.columns)):
-                col_values = []
-                for row_idx in range(len(header_0_based)):
-                    val = header_rows_data.iloc[row_idx, col_idx]
-                    if pd.notna(val) and str(val).strip() and 'Unnamed' not in str(val):
-                        val_str = str(val).strip()
-                        # 只包含短值（可能是表头，不是数据）
-                        if len(val_str) <= 50:  # 表头通常很短
-                            col_values.append(val_str)
+            new_columns = []
+            for col_idx, (col_strs, col_keep) in enumerate(zip(stripped.T, keep.T)):
+                col_values = col_strs[col_keep].tolist()
                 
                 # 去重但保持顺序
                 col_values_dedup = list(OrderedDict.fromkeys(col_values))
@@ -654,9 +1094,8 @@ class ExcelPreprocessor:
                     col_name = f'Column_{col_idx}'
                 new_columns.append(col_name)
             
-            df_raw.columns = new_columns
             data_start = max(header_0_based) + 1
-            return df_raw.iloc[data_start:].reset_index(drop=True)
+            return pd.DataFrame(values[data_start:], columns=new_columns, dtype=object, copy=False)
     
     def _clean_column_names(self, columns: pd.Index) -> List[str]:
         """
@@ -683,69 +1122,196 @@ class ExcelPreprocessor:
         Returns:
             重塑后的DataFrame
         """
-        # 删除完全为空的行和列
-        df = df.dropna(how='all').dropna(axis=1, how='all')
+        # 删除完全为空的行和列：只计算一次缺失值掩码，行列一起筛选
+        # （被删除的行全为空，所以按全表判断空列与先删行后再判断结果相同）
+        na = df.isna().to_numpy()
+        keep_rows = ~na.all(axis=1)
+        keep_cols = ~na.all(axis=0)
+        if not (keep_rows.all() and keep_cols.all()):
+            df = df.iloc[keep_rows, keep_cols]
         
         # 重置索引
-        df = df.reset_index(drop=True)
+        df = df.set_axis(pd.RangeIndex(len(df)), axis=0)
+        
+        df.columns = self._normalize_columns(df.columns)
         
-        # 清理列名：去除空格，处理特殊字符，处理NaN值
+        return df
+    
+    def _normalize_columns(self, columns) -> List[str]:
+        """清理列名（去除空格，NaN改为Unnamed_序号）并确保唯一"""
         cleaned_columns = []
-        for col in df.columns:
+        for col in columns:
             if pd.isna(col):
                 cleaned_columns.append(f"Unnamed_{len(cleaned_columns)}")
             else:
                 cleaned_columns.append(str(col).strip())
-        df.columns = cleaned_columns
         
         # 确保列名唯一
-        df.columns = self._make_unique_columns(df.columns)
+        return self._make_unique_columns(cleaned_columns)
+    
+    def _compact_dtypes(self, df: pd.DataFrame, category_ratio: float = 0.5) -> pd.DataFrame:
+        """
+        压缩常驻DataFrame的列类型
+        
+        - 整数列向下转型为最小的整数类型（浮点列保持float64，避免精度损失）
+        - 低基数的字符串列转为category
+        - 其余纯字符串列在安装了pyarrow时使用Arrow字符串存储
+        
+        Args:
+            df: 重塑后的DataFrame（列名唯一）
+            category_ratio: 唯一值占比低于该值的字符串列转为category
+            
+        Returns:
+            类型压缩后的DataFrame
+        """
+        n_rows = len(df)
+        if n_rows == 0:
+            return df
+        
+        for i in range(df.shape[1]):
+            col = df.iloc[:, i]
+            kind = col.dtype.kind
+            if kind in 'iu':
+                df.isetitem(i, pd.to_numeric(col, downcast='integer'))
+            elif kind == 'O' and pd.api.types.infer_dtype(col, skipna=True) == 'string':
+                if col.nunique() / n_rows < category_ratio:
+                    df.isetitem(i, col.astype('category'))
+                elif PYARROW_AVAILABLE:
+                    df.isetitem(i, col.astype('string[pyarrow]'))
         
         return df
     
     def _make_unique_columns(self, columns: List) -> List:
-        """确保列名唯一"""
-        seen = {}
-        result = []
-        for col in columns:
-            if col in seen:
-                seen[col] += 1
-                result.append(f"{col}_{seen[col]}")
-            else:
-                seen[col] = 0
-                result.append(col)
-        return result
+        """确保列名唯一（重复列名依次追加 _1、_2 ...）"""
+        names = pd.Series(list(columns), dtype=object)
+        if names.is_unique:
+            return names.tolist()
+        counts = names.groupby(names, sort=False, dropna=False).cumcount()
+        renamed = names.astype(str) + '_' + counts.astype(str)
+        return names.where(counts == 0, renamed).tolist()
     
-    def load_all_files(self) -> Dict[str, pd.DataFrame]:
+    def load_all_files(self, skip_unchanged: bool = False, max_workers: Optional[int] = None,
+                       lazy: bool = False) -> Dict[str, pd.DataFrame]:
         """
         加载知识库中的所有Excel文件
         
+        各文件的解析相互独立，使用线程池并行加载
+        
+        Args:
+            skip_unchanged: 为True时，修改时间、大小和处理方式都未变化的已加载文件不再重新解析，
+                已从知识库删除的文件会被移除
+            max_workers: 最大并行加载数，默认为CPU核数
+            lazy: 为True时只读取表头登记文件，首次访问processed_files[文件名]或get_file_info时才解析数据；
+                解析前file_metadata中是原始表头的列名和由sheet尺寸估算的形状
+        
         Returns:
             文件名到DataFrame的映射
         """
         if not os.path.exists(self.knowledge_base_path):
             return {}
         
-        excel_files = [f for f in os.listdir(self.knowledge_base_path) 
-                      if f.endswith(('.xlsx', '.xls'))]
+        with os.scandir(self.knowledge_base_path) as it:
+            excel_files = {entry.name: entry for entry in it
+                           if entry.name.lower().endswith(EXCEL_EXTENSIONS) and entry.is_file()}
+        
+        if skip_unchanged:
+            for stale in set(self.processed_files) - excel_files.keys():
+                self.processed_files.pop(stale, None)
+                self.file_metadata.pop(stale, None)
+                self._load_signatures.pop(stale, None)
+                self._search_blobs.pop(stale, None)
+        
+        pending = []
+        for file, entry in excel_files.items():
+            file_path = entry.path
+            try:
+                if (skip_unchanged and file in self.processed_files
+                        and self._load_signatures.get(file) == self._file_signature(file_path, stat=entry.stat())):
+                    continue
+            except OSError as e:
+                logger.warning(f"无法加载文件 {file}: {str(e)}")
+                continue
+            pending.append((file, file_path))
+        
+        if not pending:
+            return self.processed_files
+        
+        def register(item):
+            file, file_path = item
+            # 惰性登记时读取表头，文件选择和关键词搜索不需要等数据解析
+            metadata = {'path': file_path, 'columns': [], 'shape': (0, 0)}
+            try:
+                metadata.update(self._read_header_info(file_path))
+            except Exception as e:
+                logger.warning(f"无法读取表头 {file}: {str(e)}")
+            self.processed_files.register(file, file_path)
+            self.file_metadata[file] = metadata
+            self._search_blobs[file] = self._build_search_blob(file, metadata['columns'])
         
-        for file in excel_files:
-            file_path = os.path.join(self.knowledge_base_path, file)
+        def load(item):
+            file, file_path = item
             try:
                 self.load_excel_file(file_path)
             except Exception as e:
                 logger.warning(f"无法加载文件 {file}: {str(e)}")
         
+        workers = min(max_workers or os.cpu_count() or 1, len(pending))
+        if lazy:
+            if workers == 1:
+                for item in pending:
+                    register(item)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(register, pending))
+            return self.processed_files
+        
+        if workers == 1:
+            for item in pending:
+                load(item)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(load, pending))
+        
         return self.processed_files
     
+    def _read_header_info(self, file_path: str) -> Dict:
+        """
+        读取数据最多的sheet的表头行
+        
+        Returns:
+            {'columns': 清理后的列名, 'shape': (估算的数据行数, 列数)}
+        """
+        with self._open_excel(file_path) as excel_file:
+            sheets = excel_file.sheet_names
+            # 引擎无法提供尺寸时不逐个解析，使用第一个sheet
+            best_sheet = self._largest_sheet(excel_file) or sheets[0]
+            columns = self._normalize_columns(excel_file.parse(sheet_name=best_sheet, header=0, nrows=0).columns)
+            height = self._sheet_height(excel_file, best_sheet) or 1
+        return {'columns': columns, 'shape': (max(height - 1, 0), len(columns))}
+    
+    def _load_pending(self, file_name: str, file_path: str) -> None:
+        """解析惰性登记的文件；失败时记录警告并移除该文件"""
+        try:
+            self.load_excel_file(file_path)
+        except Exception as e:
+            logger.warning(f"无法加载文件 {file_name}: {str(e)}")
+            self.file_metadata.pop(file_name, None)
+    
     def get_file_info(self, file_name: str) -> Optional[Dict]:
-        """获取文件信息"""
+        """获取文件信息（惰性登记的文件在此时解析）"""
+        if self.processed_files.is_pending(file_name):
+            self.processed_files.get(file_name)
         return self.file_metadata.get(file_name)
     
     def get_all_files_info(self) -> Dict[str, Dict]:
         """获取所有文件的信息"""
         return self.file_metadata
     
+    @staticmethod
+    def _build_search_blob(file_name: str, columns) -> str:
+        """生成关键词搜索文本：文件名与列名用\x00分隔，关键词不会跨两者匹配"""
+        return f"{file_name.lower()}\x00{' '.join(str(col).lower() for col in columns)}"
+    
     def search_files_by_keywords(self, keywords: List[str]) -> List[str]:
         """
         根据关键词搜索相关文件
@@ -756,19 +1322,29 @@ class ExcelPreprocessor:
         Returns:
             匹配的文件名列表
         """
-        matching_files = []
         keywords_lower = [k.lower() for k in keywords]
+        if not keywords_lower:
+            return []
+        if '' in keywords_lower:
+            # 空关键词是任何字符串的子串
+            return list(self.file_metadata)
+        
+        if AHOCORASICK_AVAILABLE:
+            # 所有关键词构建一个自动机，每个文件只需线性扫描一遍
+            automaton = ahocorasick.Automaton()
+            for i, kw in enumerate(keywords_lower):
+                automaton.add_word(kw, i)
+            automaton.make_automaton()
+            contains_keyword = lambda text: next(automaton.iter(text), None) is not None
+        else:
+            contains_keyword = lambda text: any(kw in text for kw in keywords_lower)
         
+        matching_files = []
         for file_name, metadata in self.file_metadata.items():
-            # 检查文件名
-            file_lower = file_name.lower()
-            if any(kw in file_lower for kw in keywords_lower):
-                matching_files.append(file_name)
-                continue
-            
-            # 检查列名
-            columns = [str(col).lower() for col in metadata['columns']]
-            if any(kw in ' '.join(columns) for kw in keywords_lower):
+            blob = self._search_blobs.get(file_name)
+            if blob is None:
+                blob = self._search_blobs[file_name] = self._build_search_blob(file_name, metadata.get('columns', []))
+            if contains_keyword(blob):
                 matching_files.append(file_name)
         
         return matching_files
@@ -781,28 +1357,29 @@ class ExcelPreprocessor:
             file_name: 文件名
             df: 预处理后的DataFrame
         """
-        print("\n" + "=" * 70)
-        print(f"📊 预处理后的表头信息: {file_name}")
-        print("=" * 70)
-        print(f"数据形状: {df.shape[0]} 行 × {df.shape[1]} 列")
-        print(f"\n列名列表 ({len(df.columns)} 列):")
-        print("-" * 70)
-        for i, col in enumerate(df.columns, 1):
-            dtype = df[col].dtype
-            non_null_count = df[col].notna().sum()
-            print(f"  {i:2d}. {col:30s} | 类型: {str(dtype):10s} | 非空值: {non_null_count}/{len(df)}")
-        
-        print("\n前5行数据预览:")
-        print("-" * 70)
-        if len(df) > 0:
-            # 显示前5行，限制列宽以便查看
-            preview_df = df.head(5)
-            # 如果列太多，只显示前10列
-            if len(df.columns) > 10:
-                preview_df = preview_df.iloc[:, :10]
-                print(f"(仅显示前10列，共{len(df.columns)}列)")
-            print(preview_df.to_string())
-        else:
-            print("  (数据为空)")
-        
-        print("=" * 70 + "\n")
+        with self._print_lock:
+            print("\n" + "=" * 70)
+            print(f"📊 预处理后的表头信息: {file_name}")
+            print("=" * 70)
+            print(f"数据形状: {df.shape[0]} 行 × {df.shape[1]} 列")
+            print(f"\n列名列表 ({len(df.columns)} 列):")
+            print("-" * 70)
+            for i, col in enumerate(df.columns, 1):
+                dtype = df[col].dtype
+                non_null_count = df[col].notna().sum()
+                print(f"  {i:2d}. {col:30s} | 类型: {str(dtype):10s} | 非空值: {non_null_count}/{len(df)}")
+            
+            print("\n前5行数据预览:")
+            print("-" * 70)
+            if len(df) > 0:
+                # 显示前5行，限制列宽以便查看
+                preview_df = df.head(5)
+                # 如果列太多，只显示前10列
+                if len(df.columns) > 10:
+                    preview_df = preview_df.iloc[:, :10]
+                    print(f"(仅显示前10列，共{len(df.columns)}列)")
+                print(preview_df.to_string())
+            else:
+                print("  (数据为空)")
+            
+            print("=" * 70 + "\n")
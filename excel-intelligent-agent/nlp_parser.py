@@ -11,16 +11,20 @@ import re
 class NLPParser:
     """自然语言解析器"""
     
-    def __init__(self, api_key: str, model: str = "gpt-4"):
+    def __init__(self, api_key: str, model: str = "gpt-4", client: Optional[openai.OpenAI] = None):
         """
         初始化NLP解析器
         
         Args:
             api_key: OpenAI API密钥
             model: 使用的模型名称
+            client: 可选的已有OpenAI客户端，与其他模块共享同一个HTTP连接池
         """
         self.model = model
-        self.client = openai.OpenAI(api_key=api_key)
+        self.client = client or openai.OpenAI(api_key=api_key)
+        # 文件信息摘要缓存：调用方传入同一个文件信息对象时直接复用
+        self._summary_source = None
+        self._summary = ""
     
     def parse_query(self, query: str, available_files: Dict[str, Dict]) -> Dict:
         """
@@ -95,11 +99,15 @@ class NLPParser:
     
     def _build_files_summary(self, available_files: Dict[str, Dict]) -> str:
         """构建文件信息摘要"""
+        if available_files is self._summary_source:
+            return self._summary
         summary_parts = []
         for file_name, info in available_files.items():
             columns = ', '.join(info.get('columns', []))
             summary_parts.append(f"- {file_name}: 列名=[{columns}], 行数={info.get('shape', (0, 0))[0]}")
-        return '\n'.join(summary_parts)
+        self._summary_source = available_files
+        self._summary = '\n'.join(summary_parts)
+        return self._summary
     
     def _validate_result(self, result: Dict, available_files: Dict[str, Dict]) -> Dict:
         """验证和修正解析结果"""
@@ -123,15 +131,20 @@ class NLPParser:
             available_columns = available_files[target_file].get('columns', [])
             target_columns = result.get('target_columns', [])
             
-            # 过滤掉不存在的列
-            valid_columns = [col for col in target_columns if col in available_columns]
+            # 过滤掉不存在的列（用集合判断存在性，避免对列名列表逐个扫描）
+            available_set = set(available_columns)
+            valid_columns = [col for col in target_columns if col in available_set]
             
             # 如果所有列都不存在，尝试模糊匹配
             if not valid_columns and target_columns:
+                available_lower = [(avail_col, avail_col.lower()) for avail_col in available_columns]
+                matched = set()
                 for col in target_columns:
-                    for avail_col in available_columns:
-                        if col.lower() in avail_col.lower() or avail_col.lower() in col.lower():
-                            if avail_col not in valid_columns:
+                    col_lower = col.lower()
+                    for avail_col, avail_lower in available_lower:
+                        if col_lower in avail_lower or avail_lower in col_lower:
+                            if avail_col not in matched:
+                                matched.add(avail_col)
                                 valid_columns.append(avail_col)
             
             result['target_columns'] = valid_columns if valid_columns else available_columns[:3]